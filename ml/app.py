@@ -1,17 +1,19 @@
 import os
-import pickle
+import time
 import numpy as np
 import pandas as pd
 import logging
 # import logstash
 import sys
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from contextlib import asynccontextmanager
-from pydantic import BaseModel
-from typing import Dict, List, Union
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Union
 import logging
 import logstash
 import sys
+from log_pipeline import start_pipeline
 
 # ─── Logging Configuration ───────────────────────────────────────
 logger = logging.getLogger("MLServiceLogger")
@@ -26,17 +28,21 @@ class OptionalFieldsFilter(logging.Filter):
             record.item_id = 'null'
         return True
 
+# Handlers run on the log shipping thread (log_pipeline); the request path
+# only enqueues records
+log_handlers = []
+
 # Logstash Handler
 try:
     logstash_handler = logstash.TCPLogstashHandler(
-        host='logstash',
-        port=5044,
+        host=os.getenv("LOGSTASH_HOST", "logstash"),
+        port=int(os.getenv("LOGSTASH_PORT", "5044")),
         version=1
     )
     logstash_handler.addFilter(OptionalFieldsFilter())
-    logger.addHandler(logstash_handler)
+    log_handlers.append(logstash_handler)
 except Exception as e:
-    logger.error(f"Failed to initialize Logstash handler: {str(e)}")
+    print(f"Failed to initialize Logstash handler: {str(e)}", file=sys.stderr)
 
 # Console Handler with safe formatting
 stream_handler = logging.StreamHandler(sys.stdout)
@@ -49,10 +55,22 @@ formatter = logging.Formatter(
 
 stream_handler.setFormatter(formatter)
 stream_handler.addFilter(OptionalFieldsFilter())
-logger.addHandler(stream_handler)
+log_handlers.append(stream_handler)
+
+log_listener = start_pipeline(logger, log_handlers)
+# per-request INFO lines, sampled at LOG_INFO_SAMPLE_RATE
+request_logger = logging.getLogger("MLServiceLogger.requests")
 
-from data_manager import data_manager, DATA_DIR, MODEL_DIR
+from executor import Saturated, executor
+from metrics import REGISTRY, RECOMMEND_STAGE_SECONDS, REQUEST_SECONDS, TOP_N_CACHE
+from data_manager import data_manager, DATA_DIR, MODEL_DIR, lookup_user_row, lookup_user_rows
 from model_manager import model_manager
+from ratings_export import EXPORT_PAGE_SIZE, EXPORT_MAX_PAGE_SIZE, CursorExpired, read_ratings_page, ndjson_lines
+from startup import StartupProgress, start_loading
+from scoring import (
+    score_items, top_n_items, top_n_batch, cold_start_profiles,
+    table_neighbors, query_neighbors, cached_top_n
+)
 
 # ─── Pydantic schemas ─────────────────────────────────────────────
 class UserCreate(BaseModel):
@@ -66,129 +84,196 @@ class FeedbackIn(BaseModel):
     item_id: int
     rating: float
 
+# Upper bounds for /ml/recommend/batch requests
+BATCH_MAX_USERS = int(os.getenv("BATCH_MAX_USERS", "1000"))
+BATCH_MAX_TOP_N = int(os.getenv("BATCH_MAX_TOP_N", "100"))
+
+class BatchRecommendIn(BaseModel):
+    user_ids: List[int] = Field(..., max_length=BATCH_MAX_USERS)
+    top_n: int = Field(10, ge=1, le=BATCH_MAX_TOP_N)
+
+# ─── Helpers ──────────────────────────────────────────────────────
+def cold_start_neighbors(M: Dict, meta: pd.DataFrame):
+    """
+    Neighbours/weights for cold-start user metadata rows. Users sharing the same
+    (age, gender, occupation) get identical neighbours, so results are cached
+    per demographic tuple and only unseen tuples hit kneighbors.
+    """
+    cache = data_manager.cold_start_cache
+    keys = list(zip(meta["age"].astype(int), meta["gender"], meta["occupation"]))
+    found = {k: cache.get(k) for k in dict.fromkeys(keys)}
+
+    missing = [k for k, v in found.items() if v is None]
+    if missing:
+        rows = pd.DataFrame(missing, columns=["age", "gender", "occupation"])
+        profiles = cold_start_profiles(M, rows)
+        neighbors, weights = query_neighbors(M, profiles)
+        for k, p, n, w in zip(missing, profiles, neighbors, weights):
+            found[k] = (p, n, w)
+            cache.put(k, found[k])
+
+    neighbors = np.vstack([found[k][1] for k in keys])
+    weights = np.vstack([found[k][2] for k in keys])
+    return neighbors, weights
+
+# ─── Metrics ──────────────────────────────────────────────────────
+def _model_gauges():
+    status = model_manager.get_status()
+    return {
+        ("version",): status["version"],
+        ("bundle_version",): status["bundle_version"] or 0,
+        ("folded_users",): status["folded_users"],
+        ("drift",): status["drift"],
+    }
+
+def _cold_start_cache(field):
+    return lambda: {(): data_manager.cold_start_cache.stats()[field]}
+
+REGISTRY.gauge("ml_model_info", "Published model version, bundle version and fold-in drift.",
+               ["field"], callback=_model_gauges)
+REGISTRY.counter("ml_cold_start_cache_hits_total", "Cold-start neighbour cache hits.",
+                 callback=_cold_start_cache("hits"))
+REGISTRY.counter("ml_cold_start_cache_misses_total", "Cold-start neighbour cache misses.",
+                 callback=_cold_start_cache("misses"))
+REGISTRY.gauge("ml_cold_start_cache_size", "Entries in the cold-start neighbour cache.",
+               callback=_cold_start_cache("size"))
+REGISTRY.gauge("ml_top_n_cache_users", "Users with a precomputed top-N list.",
+               callback=lambda: {(): len(data_manager.app_state["models"].get("top_n") or {})})
+REGISTRY.gauge("ml_feedback_pending", "Feedback ratings buffered since the last merge.",
+               callback=lambda: {(): data_manager.app_state["data"]["feedback_count"]})
+REGISTRY.gauge("ml_scoring_pool_in_flight", "Scoring jobs running or queued.",
+               callback=lambda: {(): executor.stats()["in_flight"]})
+REGISTRY.gauge("ml_scoring_pool_capacity", "Scoring jobs accepted before answering 429.",
+               callback=lambda: {(): executor.stats()["capacity"]})
+REGISTRY.counter("ml_scoring_pool_rejected_total", "Requests rejected with 429.",
+                 callback=lambda: {(): executor.stats()["rejected"]})
+REGISTRY.counter("ml_retrain_runs_total", "Completed background full retrains.",
+                 callback=lambda: {(): model_manager.get_status()["runs"]})
+REGISTRY.counter("ml_fold_ins_total", "Completed fold-in batches.",
+                 callback=lambda: {(): model_manager.get_status()["fold_ins"]})
+
+# ─── Startup ──────────────────────────────────────────────────────
+startup = StartupProgress()
+# answered while the models are still loading
+ALWAYS_AVAILABLE = {"/ml/healthz", "/ml/readyz", "/ml/metrics"}
+
+REGISTRY.gauge("ml_ready", "1 once data and models are loaded and requests are served.",
+               callback=lambda: {(): int(startup.ready)})
+REGISTRY.gauge("ml_startup_seconds", "Seconds from app start-up to ready (0 until ready).",
+               callback=lambda: {(): startup.ready_after or 0})
+
 # ─── FastAPI app with lifespan ──────────────────────────────────────
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Initializing ML service state")
-    
-    try:
-        data_manager.initialize_state()
-        if not os.path.exists(os.path.join(MODEL_DIR, "user_ids.pkl")):
-            logger.warning("No existing model found, starting initial training")
-            model_manager.train_model()
-
-        models = {}
-        for name in [
-            "user_ids", "item_ids", "item_factors",
-            "user_profiles", "nn_model", "global_mean",
-            "svd", "scaler_age", "ohe_gender", "ohe_occupation"
-        ]:
-            path = os.path.join(MODEL_DIR, f"{name}.pkl")
-            with open(path, "rb") as f:
-                models[name] = pickle.load(f)
-                logger.debug(f"Loaded model component: {name}")
-
-        up = models["user_profiles"]
-        dists, idxs = models["nn_model"].kneighbors(up)
-        models["all_neighbors"] = {"distances": dists, "indices": idxs}
-        data_manager.app_state["models"] = models
-
-        logger.info("Service initialization completed successfully",
-                  extra={'user_id': 'system', 'item_id': 'system'})
-        
-    except Exception as e:
-        logger.error(f"Initialization failed: {str(e)}",
-                   extra={'user_id': 'system', 'item_id': 'system'})
-        raise RuntimeError(f"Model loading failed: {e}")
+    # load in the background; /ml/readyz reports progress meanwhile
+    start_loading(startup)
 
     yield
 
+    executor.shutdown()
+    data_manager.feedback_log.close()
+    log_listener.stop()
+
 app = FastAPI(lifespan=lifespan)
 
+@app.middleware("http")
+async def require_ready(request: Request, call_next):
+    # registered before record_latency, so it runs inside it and 503s are timed
+    if not startup.ready and request.url.path not in ALWAYS_AVAILABLE:
+        return JSONResponse(status_code=503, content={"detail": f"ML service is {startup.state}"},
+                            headers={"Retry-After": "1"})
+    return await call_next(request)
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # label by route template so /ml/recommend/{user_id} is one series
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method,
+                                route=getattr(route, "path", "unmatched"), status=status)
+
+@app.exception_handler(Saturated)
+async def saturated_handler(request: Request, exc: Saturated):
+    # backpressure: the client (or the ingress) retries, the HPA adds pods
+    logger.warning(f"Rejecting request, scoring pool saturated: {exc}")
+    return JSONResponse(status_code=429, content={"detail": "ML service is saturated, retry later"},
+                        headers={"Retry-After": "1"})
+
 # ─── Endpoints ─────────────────────────────────────────────────────
 @app.get("/ml/users")
-async def get_all_users():
+async def get_all_users(cursor: Optional[int] = None, limit: int = EXPORT_PAGE_SIZE,
+                        updated_since: Optional[float] = None):
+    """
+    One page of user metadata (raw age, gender, occupation, zip code) as a
+    JSON array, ordered by user_id. `cursor` is the last user_id already
+    received, returned as X-Next-Cursor while more pages remain;
+    `updated_since` (unix seconds) keeps users written at or after it.
+    """
     try:
-        logger.info("Fetching all users")
-        M = data_manager.app_state["models"]
-        svd_components = 50
-        
-        user_meta = []
-        for idx, user_id in enumerate(M["user_ids"]):
-            profile = M["user_profiles"][idx]
-            age = float(profile[svd_components])
-            gender = 'M' if profile[svd_components + 1] > 0.5 else 'F'
-            occ_features = profile[svd_components + 2:svd_components + 23]
-            occupation = str(M["ohe_occupation"].inverse_transform([occ_features])[0][0])
-
-            user_meta.append({
-                "user_id": int(user_id),
-                "age": age,
-                "gender": gender,
-                "occupation": occupation
-            })
-            
-        logger.info(f"Returning {len(user_meta)} users")
-        return user_meta
-        
+        export_time = int(time.time())
+        user_ids, updated, lines = await executor.run_io(data_manager.user_export)
+        start = 0 if cursor is None else int(np.searchsorted(user_ids, cursor, side="right"))
+        rows = np.arange(start, len(user_ids))
+        if updated_since is not None:
+            rows = rows[updated[start:] >= updated_since]
+        limit = max(1, min(limit, EXPORT_MAX_PAGE_SIZE))
+        page = rows[:limit]
     except Exception as e:
         logger.error(f"Failed to fetch users: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    request_logger.info(f"Returning {len(page)} users")
+    headers = {"X-Export-Time": str(export_time)}
+    if len(rows) > limit:
+        headers["X-Next-Cursor"] = str(user_ids[page[-1]])
+    body = "[" + ",".join(lines[page]) + "]"
+    return Response(body, media_type="application/json", headers=headers)
+
 @app.get("/ml/ratings")
-async def get_all_ratings():
+async def get_all_ratings(cursor: Optional[str] = None, limit: int = EXPORT_PAGE_SIZE,
+                          since: Optional[int] = None):
+    """
+    One page of ratings as NDJSON (u1.base, then buffered feedback in
+    write order: a re-rated item appears once per rating, the last wins).
+    Pass the X-Next-Cursor header back as `cursor` for the next page; it is
+    absent on the last one. `since` (unix seconds) limits the export to
+    ratings written at or after that time. A 410 means the data was merged
+    mid-export and the client should restart from the first page.
+    """
     try:
-        logger.info("Fetching all ratings")
-        base_path = os.path.join(DATA_DIR, "u1.base")
-        feedback_path = os.path.join(DATA_DIR, "feedback.csv")
-
-        base_df = pd.read_csv(
-            base_path,
-            sep='\t',
-            names=["user_id", "item_id", "rating", "timestamp"],
-            dtype={'user_id': 'int32', 'item_id': 'int32', 
-                   'rating': 'float32', 'timestamp': 'int64'}
+        export_time = int(time.time())
+        page, next_cursor = await executor.run_io(
+            read_ratings_page, os.path.join(DATA_DIR, "u1.base"),
+            data_manager.feedback_log, cursor, limit, since,
         )
-
-        try:
-            feedback_df = pd.read_csv(
-                feedback_path,
-                header=0,
-                names=["user_id", "item_id", "rating"],
-                dtype={'user_id': 'int32', 'item_id': 'int32', 'rating': 'float32'}
-            )
-            current_ts = int(pd.Timestamp.now().timestamp())
-            feedback_df = feedback_df.assign(timestamp=current_ts)
-            
-        except FileNotFoundError:
-            feedback_df = pd.DataFrame(columns=["user_id", "item_id", "rating", "timestamp"])
-            logger.warning("No feedback file found")
-
-        combined = pd.concat([base_df, feedback_df], ignore_index=True)
-        combined = combined.astype({
-            'user_id': 'int32',
-            'item_id': 'int32',
-            'rating': 'float32',
-            'timestamp': 'int64'
-        }, errors='ignore')
-
-        combined = combined.dropna(subset=['user_id', 'item_id', 'rating'])
-        logger.info(f"Returning {len(combined)} ratings")
-        return combined.to_dict(orient="records")
-        
+    except CursorExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to fetch ratings: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    request_logger.info(f"Returning {len(page)} ratings")
+    headers = {"X-Export-Time": str(export_time)}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return StreamingResponse(ndjson_lines(page), media_type="application/x-ndjson", headers=headers)
+
 @app.post("/ml/users/create")
 async def create_user(user_data: UserCreate):
     try:
-        raw = data_manager.get_next_user_id()
-        new_id = int(raw)
-        path = os.path.join(DATA_DIR, "u.user")
-        with open(path, "a") as f:
-            f.write(f"{new_id}|{user_data.age}|{user_data.gender}|"
-                    f"{user_data.occupation}|{user_data.zip_code}\n")
+        new_id = await executor.run_io(
+            data_manager.create_user,
+            user_data.age, user_data.gender, user_data.occupation, user_data.zip_code
+        )
             
         logger.info("User created", extra={
             "user_id": new_id,
@@ -207,17 +292,20 @@ async def create_user(user_data: UserCreate):
 @app.post("/ml/feedback")
 async def submit_feedback(feedback: FeedbackIn):
     try:
-        logger.info("Receiving feedback", extra={
+        request_logger.info("Receiving feedback", extra={
             "user_id": feedback.user_id,
             "item_id": feedback.item_id,
             "rating": feedback.rating
         })
-        data_manager.add_feedback(feedback.user_id, feedback.item_id, feedback.rating)
-        
-        if data_manager.check_retrain_needed(threshold=100):
-            logger.info("Initiating model retraining")
-            model_manager.train_model()
-            
+        await executor.run_io(data_manager.add_feedback, feedback.user_id, feedback.item_id, feedback.rating)
+        # fold the user into the current factors now; a full refit is only
+        # scheduled once fold-in drift or the refit interval is exceeded
+        model_manager.request_fold_in([feedback.user_id])
+
+        if await executor.run_io(data_manager.check_retrain_needed, 100):
+            logger.info("Merged buffered feedback into the base ratings")
+            model_manager.maybe_full_retrain()
+
         return {"status": "feedback recorded"}
     except Exception as e:
         logger.error("Feedback processing failed", extra={
@@ -227,79 +315,59 @@ async def submit_feedback(feedback: FeedbackIn):
         })
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/ml/recommend/{user_id}")
-async def get_recommendations(user_id: int):
+def recommend_user(user_id: int):
     try:
-        logger.info("Recommendation request received", extra={"user_id": user_id})
+        request_logger.info("Recommendation request received", extra={"user_id": user_id})
         
-        M = data_manager.app_state["models"]
-        ratings = data_manager.app_state["data"]["ratings"]
-        user_history = data_manager.app_state["data"]["user_history"]
-        item_titles = data_manager.app_state["data"]["item_titles"]
-
-        def neighbors_from(profile: np.ndarray):
-            d, i = M["nn_model"].kneighbors(profile)
-            neigh = i[0][1:]
-            w = 1 / (d[0][1:] + 1e-6)
-            return M["user_ids"][neigh], w
-
-        if user_id not in M["user_ids"]:
-            logger.info("Handling cold-start user", extra={"user_id": user_id})
-            try:
-                meta = pd.read_csv(
-                    os.path.join(DATA_DIR, "u.user"),
-                    sep="|",
-                    names=["user_id","age","gender","occupation","zip_code"]
-                ).set_index("user_id")
-                
-                if user_id not in meta.index:
-                    logger.warning("Unknown cold-start user", extra={"user_id": user_id})
-                    return {"recommended_items": []}
-
-                row = meta.loc[user_id]
-                age_v = M["scaler_age"].transform(pd.DataFrame([[row.age]], columns=["age"]))
-                gender_v = M["ohe_gender"].transform(pd.DataFrame([[row.gender]], columns=["gender"]))
-                occ_v = M["ohe_occupation"].transform(pd.DataFrame([[row.occupation]], columns=["occupation"]))
-                profile = np.hstack([np.zeros((1, M["svd"].n_components)), age_v, gender_v, occ_v])
-                neighbors, weights = neighbors_from(profile)
-            except Exception as e:
-                logger.error("Cold-start processing failed", extra={"user_id": user_id, "error": str(e)})
-                raise HTTPException(status_code=500, detail=f"Cold-start processing failed: {str(e)}")
-        else:
-            idxs = np.where(M["user_ids"] == user_id)[0]
-            if not idxs.size:
-                logger.warning("User not found in model", extra={"user_id": user_id})
-                return {"recommended_items": []}
-                
-            uprof = M["user_profiles"][idxs[0]].reshape(1, -1)
-            neighbors, weights = neighbors_from(uprof)
-
-        nbr_df = ratings[ratings["user"].isin(neighbors)]
-        if nbr_df.empty:
+        M, data = data_manager.snapshot()
+        matrices, item_titles = data["rating_matrices"], data["item_titles"]
+
+        with RECOMMEND_STAGE_SECONDS.time(stage="lookup"):
+            cached = cached_top_n(M.get("top_n"), matrices, user_id)
+            row = lookup_user_row(M, user_id) if cached is None else -1
+        TOP_N_CACHE.inc(result="miss" if cached is None else "hit")
+        if cached is not None:
+            request_logger.info("Recommendation served from top-N cache", extra={"user_id": user_id})
+            return {
+                "recommended_items": [
+                    {"item_id": int(i), "title": item_titles.get(int(i), "Unknown")}
+                    for i in cached
+                ]
+            }
+
+        with RECOMMEND_STAGE_SECONDS.time(stage="neighbors"):
+            if row < 0:
+                request_logger.info("Handling cold-start user", extra={"user_id": user_id})
+                try:
+                    meta = data_manager.user_rows([user_id])
+                    if meta.empty:
+                        logger.warning("Unknown cold-start user", extra={"user_id": user_id})
+                        return {"recommended_items": []}
+
+                    neighbors, weights = cold_start_neighbors(M, meta)
+                except Exception as e:
+                    logger.error("Cold-start processing failed", extra={"user_id": user_id, "error": str(e)})
+                    raise HTTPException(status_code=500, detail=f"Cold-start processing failed: {str(e)}")
+            else:
+                neighbors, weights = table_neighbors(M, [row])
+
+        with RECOMMEND_STAGE_SECONDS.time(stage="scoring"):
+            pred, candidates = score_items(matrices, neighbors[0], weights[0], float(M["global_mean"]))
+        if not candidates.any():
             logger.warning("No neighbors found for user", extra={"user_id": user_id})
             return {"recommended_items": []}
 
-        wr = nbr_df.merge(pd.Series(weights, index=neighbors).rename("w"), left_on="user", right_index=True)
-        wr["ws"] = wr["rating"] * wr["w"]
-
-        agg = wr.groupby("item").agg(
-            total_score  = ("ws", "sum"),
-            total_weight = ("w",  "sum")
-        )
-        gm = float(M["global_mean"])
-        agg["pred"] = agg["total_score"] / (agg["total_weight"] + 1e-9) + gm
-
-        seen = user_history.get(user_id, set())
-        cand = agg[~agg.index.isin(seen)]
-        top = cand.nlargest(10, "pred").index.astype(int)
+        with RECOMMEND_STAGE_SECONDS.time(stage="top_n"):
+            seen = matrices.rated_items(user_id)
+            top = top_n_items(pred, candidates, seen, n=10)
 
-        logger.info("Recommendation generated", extra={
+        request_logger.info("Recommendation generated", extra={
             "user_id": user_id,
             "num_items": len(top)
         })
         return {
             "recommended_items": [
-                {"item_id": i, "title": item_titles.get(i, "Unknown")}
+                {"item_id": int(i), "title": item_titles.get(int(i), "Unknown")}
                 for i in top
             ]
         }
@@ -311,17 +379,111 @@ async def get_recommendations(user_id: int):
         })
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/ml/recommend/{user_id}")
+async def get_recommendations(user_id: int):
+    return await executor.run_cpu(recommend_user, user_id)
+
+def recommend_batch(request: BatchRecommendIn):
+    try:
+        request_logger.info(f"Batch recommendation request for {len(request.user_ids)} users")
+
+        M, data = data_manager.snapshot()
+        matrices, item_titles = data["rating_matrices"], data["item_titles"]
+
+        requested = list(dict.fromkeys(request.user_ids))
+        # Cache hits are answered directly; only misses are scored
+        hits = {}
+        for u in requested:
+            cached = cached_top_n(M.get("top_n"), matrices, u, n=request.top_n)
+            if cached is not None:
+                hits[u] = cached
+        misses = [u for u in requested if u not in hits]
+        TOP_N_CACHE.inc(len(hits), result="hit")
+        TOP_N_CACHE.inc(len(misses), result="miss")
+
+        rows = lookup_user_rows(M, misses)
+        warm = [u for u, r in zip(misses, rows) if r >= 0]
+        cold = [u for u, r in zip(misses, rows) if r < 0]
+
+        # Warm users come from the neighbour table; cold-start side-info
+        # profiles share a single kneighbors query
+        neighbors, weights = table_neighbors(M, rows[rows >= 0])
+        if cold:
+            meta = data_manager.user_rows(cold)
+            cold = meta.index.tolist()
+            if cold:
+                cold_n, cold_w = cold_start_neighbors(M, meta)
+                neighbors, weights = np.vstack([neighbors, cold_n]), np.vstack([weights, cold_w])
+        scored = warm + cold
+
+        tops = dict(hits)
+        if scored:
+            tops.update(zip(scored, top_n_batch(matrices, neighbors, weights,
+                                                float(M["global_mean"]), np.array(scored),
+                                                n=request.top_n)))
+
+        recommendations = {u: [] for u in requested}
+        for uid, top in tops.items():
+            recommendations[uid] = [
+                {"item_id": int(i), "title": item_titles.get(int(i), "Unknown")}
+                for i in top
+            ]
+
+        request_logger.info(f"Batch recommendation generated: {len(hits)} cached, {len(warm)} warm, "
+                    f"{len(cold)} cold-start, {len(misses) - len(scored)} unknown")
+        return {
+            "recommendations": [
+                {"user_id": uid, "recommended_items": recommendations[uid]}
+                for uid in requested
+            ]
+        }
+
+    except Exception as e:
+        logger.error("Batch recommendation failed", extra={"error": str(e)})
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/ml/recommend/batch")
+async def get_batch_recommendations(request: BatchRecommendIn):
+    return await executor.run_cpu(recommend_batch, request)
+
+@app.get("/ml/healthz")
+async def healthz():
+    """Liveness: the process answers; fails only if the startup load failed."""
+    if startup.failed:
+        return JSONResponse(status_code=503, content=startup.snapshot())
+    return {"status": "ok", "state": startup.state}
+
+@app.get("/ml/readyz")
+async def readyz():
+    """Readiness: 200 once data and models are published, else 503 with load progress."""
+    return JSONResponse(status_code=200 if startup.ready else 503, content=startup.snapshot())
+
+@app.get("/ml/metrics")
+async def get_metrics():
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/ml/cache/stats")
+async def get_cache_stats():
+    M = data_manager.app_state["models"]
+    return {
+        "cold_start": data_manager.cold_start_cache.stats(),
+        "top_n": {"users": len(M.get("top_n") or {})},
+    }
+
 @app.post("/ml/retrain")
 async def trigger_retraining():
     try:
-        logger.info("Starting model retraining")
-        model_manager.train_model()
-        logger.info("Model retraining completed successfully")
-        return {"status": "retraining completed"}
+        logger.info("Retraining requested")
+        status = model_manager.request_retrain()
+        return {"status": f"retraining {status['scheduled']}", **status}
     except Exception as e:
         logger.error("Model retraining failed", extra={"error": str(e)})
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/ml/retrain/status")
+async def get_retrain_status():
+    return model_manager.get_status()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
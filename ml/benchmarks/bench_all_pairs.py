@@ -0,0 +1,61 @@
+"""
+Benchmark: all-pairs neighbour table, single kneighbors call vs. blocked scan.
+
+Run from the ml/ directory:
+    python -m benchmarks.bench_all_pairs [--users 20000] [--block ROWS]
+
+Peak memory is measured with tracemalloc (NumPy reports its buffers there).
+ml-100k profiles are used to check the blocked table against sklearn; the
+synthetic set shows time/memory as the user count grows.
+"""
+import argparse
+import os
+import time
+import tracemalloc
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+from bundle import load_bundle, load_legacy_artifacts
+from data_manager import MODEL_DIR
+from neighbor_index import blocked_kneighbors
+from benchmarks.bench_neighbors import synthetic_profiles
+
+K = 50
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 2**20
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--block", type=int, default=None, help="rows per block (default: from NEIGHBOR_MEMORY_MB)")
+    args = parser.parse_args()
+
+    models = load_bundle(MODEL_DIR) or load_legacy_artifacts(MODEL_DIR)
+    profiles = models["user_profiles"]
+    nn = NearestNeighbors(n_neighbors=K, metric="cosine").fit(profiles)
+    d0, i0 = nn.kneighbors(profiles)
+    d1, i1 = blocked_kneighbors(profiles, K, block_size=128)
+    same = np.mean([len(np.intersect1d(a, b)) / K for a, b in zip(i0, i1)])
+    print(f"ml-100k ({len(profiles)} users): neighbour overlap with sklearn {same:.4f}, "
+          f"max |distance diff| {np.abs(d0 - d1).max():.2e}")
+
+    X = synthetic_profiles(args.users, profiles.shape[1]).astype(np.float64)
+    nn = NearestNeighbors(n_neighbors=K, metric="cosine").fit(X)
+    print(f"synthetic: {args.users} users x {X.shape[1]} dims, k={K}, {os.cpu_count()} cores")
+    _, t, peak = measure(lambda: nn.kneighbors(X))
+    print(f"  sklearn kneighbors       : {t:7.2f} s, peak {peak:8.1f} MB")
+    workers = sorted({1, 2, os.cpu_count() or 1})
+    for w in workers:
+        _, t, peak = measure(lambda: blocked_kneighbors(X, K, block_size=args.block, workers=w))
+        print(f"  blocked, {w:2d} worker(s)    : {t:7.2f} s, peak {peak:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
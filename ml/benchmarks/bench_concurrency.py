@@ -0,0 +1,141 @@
+"""
+Load test: mixed read/write throughput across uvicorn workers.
+
+Run from the ml/ directory:
+    python -m benchmarks.bench_concurrency [--workers 1 2 4] [--duration 20]
+                                           [--concurrency 32] [--write-ratio 0.1]
+
+For every worker count the service (code, ml-100k/ and model_data/) is
+copied to a scratch directory, started with `uvicorn app:app --workers N`
+and driven by --concurrency clients for --duration seconds. Reads are
+GET /ml/recommend/{id}; writes are POST /ml/feedback and, for a fifth of
+them, POST /ml/users/create. Afterwards the created ids are checked for
+duplicates, both in the responses and in the scratch u.user.
+The client runs on the same machine, so leave it spare cores.
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+import httpx
+import numpy as np
+import pandas as pd
+
+from data_manager import BASE_DIR
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def scratch_copy(dest: str):
+    shutil.copytree(BASE_DIR, dest, symlinks=True,
+                    ignore=shutil.ignore_patterns("__pycache__", "benchmarks", "*.lock"))
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float):
+    deadline = time.monotonic() + timeout
+    ready = 0
+    while ready < 10:
+        if time.monotonic() > deadline:
+            raise TimeoutError("service did not become ready")
+        try:
+            ready = ready + 1 if (await client.get("/ml/readyz")).status_code == 200 else 0
+        except httpx.TransportError:
+            ready = 0
+        await asyncio.sleep(0.2)
+
+async def drive(client, args, stop_at, samples, statuses, created):
+    rng = random.Random()
+    while time.monotonic() < stop_at:
+        if rng.random() >= args.write_ratio:
+            op, request = "recommend", client.get(f"/ml/recommend/{rng.randint(1, 943)}")
+        elif rng.random() < 0.8:
+            op, request = "feedback", client.post("/ml/feedback", json={
+                "user_id": rng.randint(1, 943), "item_id": rng.randint(1, 1682),
+                "rating": float(rng.randint(1, 5))})
+        else:
+            op, request = "create_user", client.post("/ml/users/create", json={
+                "age": rng.randint(18, 70), "gender": rng.choice("MF"),
+                "occupation": "other", "zip_code": "00000"})
+        start = time.perf_counter()
+        try:
+            response = await request
+            status = response.status_code
+        except httpx.HTTPError:
+            status = "error"
+        samples[op].append(time.perf_counter() - start)
+        statuses[op][status] += 1
+        if op == "create_user" and status == 200:
+            created.append(response.json()["user_id"])
+
+async def load(args, port: int):
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+        await wait_ready(client, args.startup_timeout)
+        # warm-up, then the measured window
+        await asyncio.gather(*(drive(client, args, time.monotonic() + args.warmup,
+                                     defaultdict(list), defaultdict(Counter), [])
+                               for _ in range(args.concurrency)))
+        samples, statuses, created = defaultdict(list), defaultdict(Counter), []
+        stop_at = time.monotonic() + args.duration
+        await asyncio.gather(*(drive(client, args, stop_at, samples, statuses, created)
+                               for _ in range(args.concurrency)))
+    return samples, statuses, created
+
+def run(workers: int, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        app_dir = os.path.join(tmp, "ml")
+        scratch_copy(app_dir)
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1",
+             "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+            cwd=app_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        try:
+            samples, statuses, created = asyncio.run(load(args, port))
+        finally:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait(timeout=60)
+
+        users = pd.read_csv(os.path.join(app_dir, "ml-100k", "u.user"), sep="|", header=None)[0]
+
+    total = sum(len(v) for v in samples.values())
+    print(f"{workers} worker(s): {total / args.duration:8.1f} req/s "
+          f"({args.concurrency} clients, write ratio {args.write_ratio})")
+    for op in ("recommend", "feedback", "create_user"):
+        if not samples[op]:
+            continue
+        p50, p99 = np.percentile(np.asarray(samples[op]) * 1e3, [50, 99])
+        codes = ", ".join(f"{k}: {v}" for k, v in sorted(statuses[op].items(), key=str))
+        print(f"  {op:12s}: {len(samples[op]) / args.duration:8.1f} req/s, "
+              f"p50 {p50:7.1f} ms, p99 {p99:7.1f} ms  [{codes}]")
+    print(f"  user ids    : {len(created)} created, {len(created) - len(set(created))} duplicate "
+          f"responses, {int(users.duplicated().sum())} duplicate lines in u.user")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cores")
+    for workers in args.workers:
+        run(workers, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Offline evaluation: train on each ml-100k split and score the held-out set.
+
+Run from the ml/ directory:
+    python -m benchmarks.bench_eval [--splits u1 u2 u3 u4 u5 ua ub] [--k 10]
+                                    [--output eval.json]
+
+For every split the model is fitted on <split>.base in a fresh process and
+evaluated on <split>.test:
+  quality : RMSE of Recommender.predict, precision/recall/NDCG@k of the
+            top-k lists (relevant = test rating >= --relevant)
+  cost    : training wall time, peak RSS, bundle save/load time and
+            recommend latency p50/p95/p99 for single and batched calls
+Results are written as JSON (stdout unless --output is given).
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import sklearn
+from concurrent.futures import ProcessPoolExecutor
+
+from bundle import load_bundle, save_bundle
+from data_manager import DATA_DIR, build_id_index
+from inference import Recommender
+from model_manager import fit_models
+from neighbor_index import neighbor_table
+from user_store import UserStore
+
+SPLITS = ["u1", "u2", "u3", "u4", "u5", "ua", "ub"]
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def read_split(name: str) -> pd.DataFrame:
+    return pd.read_csv(os.path.join(DATA_DIR, name), sep="\t",
+                       names=["user", "item", "rating", "timestamp"],
+                       usecols=["user", "item", "rating"])
+
+def percentiles_ms(samples) -> dict:
+    p50, p95, p99 = np.percentile(np.asarray(samples) * 1e3, [50, 95, 99])
+    return {"p50_ms": round(p50, 3), "p95_ms": round(p95, 3), "p99_ms": round(p99, 3)}
+
+def ranking_metrics(recommended, relevant, k: int) -> dict:
+    """Mean precision/recall/NDCG@k over users with at least one relevant item."""
+    discounts = 1 / np.log2(np.arange(2, k + 2))
+    precision, recall, ndcg = [], [], []
+    for items, rel in zip(recommended, relevant):
+        hits = np.isin(items[:k], list(rel))
+        precision.append(hits.sum() / k)
+        recall.append(hits.sum() / len(rel))
+        ideal = discounts[:min(len(rel), k)].sum()
+        ndcg.append((discounts[:len(hits)] * hits).sum() / ideal)
+    return {
+        f"precision@{k}": float(np.mean(precision)),
+        f"recall@{k}": float(np.mean(recall)),
+        f"ndcg@{k}": float(np.mean(ndcg)),
+        "users_evaluated": len(recommended),
+    }
+
+def evaluate_split(split: str, k: int, relevant_min: float, latency_users: int, batch_size: int) -> dict:
+    train, test = read_split(f"{split}.base"), read_split(f"{split}.test")
+    users = UserStore(os.path.join(DATA_DIR, "u.user"))
+    users.load()
+    rss_before = peak_rss_mb()
+
+    start = time.perf_counter()
+    models = fit_models(train, users.frame())
+    distances, indices = neighbor_table(models["nn_model"], models["user_profiles"])
+    models["all_neighbors"] = {"indices": indices, "distances": distances}
+    train_s = time.perf_counter() - start
+    rss_after = peak_rss_mb()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        save_bundle(tmp, models)
+        save_s = time.perf_counter() - start
+        start = time.perf_counter()
+        loaded = load_bundle(tmp)
+        loaded["user_index"] = build_id_index(loaded["user_ids"])
+        load_s = time.perf_counter() - start
+
+        rec = Recommender(models=loaded, ratings=train, users=users)
+
+        # quality
+        rmse = float(np.sqrt(np.mean((rec.predict(test["user"], test["item"]) - test["rating"]) ** 2)))
+        liked = test[test["rating"] >= relevant_min].groupby("user")["item"].apply(set)
+        recommended = rec.recommend_batch(liked.index.to_numpy(), top_n=k)
+        quality = {"rmse": rmse, **ranking_metrics(recommended, liked.to_numpy(), k)}
+
+        # latency
+        rng = np.random.default_rng(0)
+        sample = rng.choice(test["user"].unique(), min(latency_users, test["user"].nunique()), replace=False)
+        single = []
+        for uid in sample:
+            start = time.perf_counter()
+            rec.recommend(int(uid), top_n=k)
+            single.append(time.perf_counter() - start)
+        batched = []
+        for s in range(0, len(sample), batch_size):
+            start = time.perf_counter()
+            rec.recommend_batch(sample[s:s + batch_size], top_n=k)
+            batched.append(time.perf_counter() - start)
+
+    return {
+        "train_ratings": len(train),
+        "test_ratings": len(test),
+        "quality": quality,
+        "cost": {
+            "train_s": round(train_s, 3),
+            "peak_rss_mb": round(rss_after, 1),
+            "train_rss_delta_mb": round(rss_after - rss_before, 1),
+            "bundle_save_s": round(save_s, 4),
+            "model_load_s": round(load_s, 4),
+            "recommend_single": percentiles_ms(single),
+            "recommend_batch": {"batch_size": batch_size, **percentiles_ms(batched),
+                                "per_user_ms": round(float(np.sum(batched)) / len(sample) * 1e3, 3)},
+        },
+    }
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(DATA_DIR)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--splits", nargs="+", default=SPLITS, choices=SPLITS)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--relevant", type=float, default=4.0,
+                        help="minimum test rating counted as relevant")
+    parser.add_argument("--latency-users", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    results = {}
+    for split in args.splits:
+        # fresh process per split so peak RSS is that split's own
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+            results[split] = pool.submit(evaluate_split, split, args.k, args.relevant,
+                                         args.latency_users, args.batch_size).result()
+        print(f"{split}: rmse {results[split]['quality']['rmse']:.4f}, "
+              f"ndcg@{args.k} {results[split]['quality'][f'ndcg@{args.k}']:.4f}, "
+              f"train {results[split]['cost']['train_s']:.2f} s", file=sys.stderr)
+
+    quality_keys = [key for key in results[args.splits[0]]["quality"] if key != "users_evaluated"]
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scikit_learn": sklearn.__version__,
+            "neighbor_index": os.getenv("NEIGHBOR_INDEX", "exact"),
+            "cpu_count": os.cpu_count(),
+            "k": args.k,
+            "relevant_min_rating": args.relevant,
+        },
+        "splits": results,
+        "mean": {key: float(np.mean([r["quality"][key] for r in results.values()])) for key in quality_keys},
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
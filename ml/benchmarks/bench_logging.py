@@ -0,0 +1,123 @@
+"""
+Benchmark: cost of a log call on the request path, direct vs. queued handlers.
+
+Run from the ml/ directory:
+    python -m benchmarks.bench_logging [--records 20000] [--modes healthy slow down]
+
+A local TCP server stands in for Logstash:
+  healthy : reads as fast as it can
+  slow    : reads 4 KB every 10 ms, so socket buffers fill up
+  down    : nothing listens on the port
+Each mode logs --records INFO lines with `extra` fields, first with the
+TCPLogstashHandler attached to the logger directly (the old setup), then
+through log_pipeline. Reported: per-call latency seen by the caller, lines
+the stand-in received, and records the queue dropped.
+"""
+import argparse
+import logging
+import queue
+import socket
+import threading
+import time
+import logstash
+import numpy as np
+
+from log_pipeline import BatchingListener, DroppingQueueHandler
+
+class StandIn:
+    """Minimal line-counting TCP sink."""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.lines = 0
+        self._sock = socket.socket()
+        self._sock.bind(("127.0.0.1", 0))
+        self.port = self._sock.getsockname()[1]
+        self._stop = threading.Event()
+        if mode == "down":
+            self._sock.close()
+            return
+        self._sock.listen()
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        self._sock.settimeout(0.1)
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return  # closed
+            threading.Thread(target=self._read, args=(conn,), daemon=True).start()
+
+    def _read(self, conn: socket.socket):
+        conn.settimeout(0.1)
+        with conn:
+            while not self._stop.is_set():
+                try:
+                    chunk = conn.recv(4096)
+                except socket.timeout:
+                    continue
+                if not chunk:
+                    return
+                self.lines += chunk.count(b"\n")
+                if self.mode == "slow":
+                    time.sleep(0.01)
+
+    def close(self):
+        self._stop.set()
+        if self.mode != "down":
+            self._sock.close()
+
+def log_calls(logger: logging.Logger, records: int) -> np.ndarray:
+    latencies = np.empty(records)
+    for i in range(records):
+        start = time.perf_counter()
+        logger.info("Recommendation generated", extra={"user_id": i % 943, "item_id": "null", "num_items": 10})
+        latencies[i] = time.perf_counter() - start
+    return latencies
+
+def run(mode: str, pipeline: str, records: int, queue_size: int):
+    stand_in = StandIn(mode)
+    handler = logstash.TCPLogstashHandler(host="127.0.0.1", port=stand_in.port, version=1)
+    logger = logging.getLogger(f"bench.{mode}.{pipeline}")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    dropped = 0
+    if pipeline == "direct":
+        logger.addHandler(handler)
+        latencies = log_calls(logger, records)
+    else:
+        log_queue = queue.Queue(maxsize=queue_size)
+        queue_handler = DroppingQueueHandler(log_queue)
+        logger.addHandler(queue_handler)
+        listener = BatchingListener(log_queue, [handler])
+        listener.start()
+        latencies = log_calls(logger, records)
+        listener.stop(timeout=10)
+        dropped = queue_handler.dropped
+    time.sleep(0.5)
+    stand_in.close()
+    handler.close()
+
+    p50, p99, worst = np.percentile(latencies * 1e6, [50, 99, 100])
+    print(f"  {pipeline:7s}: p50 {p50:8.1f} us, p99 {p99:9.1f} us, max {worst / 1e3:8.1f} ms, "
+          f"total {latencies.sum():6.2f} s, received {stand_in.lines:6d}, dropped {dropped}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--modes", nargs="+", default=["healthy", "slow", "down"])
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        print(f"{mode}: {args.records} records")
+        for pipeline in ("direct", "queued"):
+            run(mode, pipeline, args.records, args.queue_size)
+
+
+if __name__ == "__main__":
+    main()
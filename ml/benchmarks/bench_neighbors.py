@@ -0,0 +1,76 @@
+"""
+Benchmark: recall@50 and build/query time of the neighbour index backends.
+
+Run from the ml/ directory:
+    python -m benchmarks.bench_neighbors [--users 1000000] [--queries 1000]
+
+ml-100k queries every trained profile (the startup all-pairs pass). The
+synthetic set is `--users` clustered profiles with the ml-100k profile width;
+a sample of `--queries` rows is queried and scored against an exact scan.
+"""
+import argparse
+import os
+import time
+import numpy as np
+
+from bundle import load_bundle, load_legacy_artifacts
+from data_manager import MODEL_DIR
+from neighbor_index import build_neighbor_index
+
+K = 50
+
+def exact_neighbors(X: np.ndarray, queries: np.ndarray, k: int = K, chunk: int = 16) -> np.ndarray:
+    """Ground-truth cosine top-k by blocked scan (bounded memory at any size)."""
+    data = X / np.linalg.norm(X, axis=1, keepdims=True)
+    Q = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    out = []
+    for s in range(0, len(Q), chunk):
+        sims = Q[s:s + chunk] @ data.T
+        out.append(np.argpartition(-sims, k - 1, axis=1)[:, :k].copy())
+    return np.vstack(out)
+
+def recall(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(np.intersect1d(t, f, assume_unique=True)) for t, f in zip(truth, found))
+    return hits / truth.size
+
+def synthetic_profiles(users: int, dim: int, clusters: int = 2000, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    X = centers[rng.integers(0, clusters, users)]
+    for s in range(0, users, 65536):
+        X[s:s + 65536] += 0.5 * rng.standard_normal((len(X[s:s + 65536]), dim), dtype=np.float32)
+    return X
+
+def run(label: str, X: np.ndarray, query_rows: np.ndarray, kinds):
+    queries = X[query_rows]
+    truth = exact_neighbors(X, queries)
+    print(f"{label}: {len(X)} profiles x {X.shape[1]} dims, {len(query_rows)} queries, k={K}")
+    for kind in kinds:
+        start = time.perf_counter()
+        index = build_neighbor_index(kind, n_neighbors=K).fit(X)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        _, found = index.kneighbors(queries)
+        query = time.perf_counter() - start
+        print(f"  {kind:6s}: build {build:8.2f} s, query {query / len(queries) * 1e3:8.3f} ms/user "
+              f"({query:7.2f} s total), recall@{K} {recall(truth, found):.4f}")
+        del index
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--kinds", nargs="+", default=["exact", "lsh", "ivf"])
+    args = parser.parse_args()
+
+    models = load_bundle(MODEL_DIR) or load_legacy_artifacts(MODEL_DIR)
+    profiles = np.asarray(models["user_profiles"], dtype=np.float32)
+    run("ml-100k", profiles, np.arange(len(profiles)), args.kinds)
+
+    X = synthetic_profiles(args.users, profiles.shape[1])
+    rows = np.random.default_rng(1).choice(len(X), min(args.queries, len(X)), replace=False)
+    run("synthetic", X, rows, args.kinds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Micro-benchmark: pandas groupby scoring vs. the sparse CSR scoring path.
+
+Run from the ml/ directory:
+    python -m benchmarks.bench_scoring [--users 200] [--repeat 3]
+"""
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+
+from bundle import load_bundle, load_legacy_artifacts
+from data_manager import data_manager, MODEL_DIR
+from scoring import score_items, top_n_items
+
+def legacy_top_n(ratings, user_history, neighbors, weights, global_mean, user_id, n=10):
+    """The original per-request pandas path from app.get_recommendations."""
+    nbr_df = ratings[ratings["user"].isin(neighbors)]
+    if nbr_df.empty:
+        return []
+    wr = nbr_df.merge(pd.Series(weights, index=neighbors).rename("w"), left_on="user", right_index=True)
+    wr["ws"] = wr["rating"] * wr["w"]
+    agg = wr.groupby("item").agg(total_score=("ws", "sum"), total_weight=("w", "sum"))
+    agg["pred"] = agg["total_score"] / (agg["total_weight"] + 1e-9) + global_mean
+    seen = user_history.get(user_id, set())
+    cand = agg[~agg.index.isin(seen)]
+    return [int(i) for i in cand.nlargest(n, "pred").index]
+
+def sparse_top_n(matrices, neighbors, weights, global_mean, user_id, n=10):
+    pred, candidates = score_items(matrices, neighbors, weights, global_mean)
+    return [int(i) for i in top_n_items(pred, candidates, matrices.rated_items(user_id), n)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data_manager.initialize_state()
+    data = data_manager.app_state["data"]
+    ratings = data_manager.load_ratings()
+    user_history = ratings.groupby("user")["item"].apply(set).to_dict()
+    models = load_bundle(MODEL_DIR) or load_legacy_artifacts(MODEL_DIR)
+    user_ids, user_profiles = models["user_ids"], models["user_profiles"]
+    nn_model, global_mean = models["nn_model"], float(models["global_mean"])
+
+    # Neighbour search is shared by both paths, so do it up front
+    rows = np.arange(min(args.users, len(user_ids)))
+    dists, idxs = nn_model.kneighbors(user_profiles[rows])
+    cases = [
+        (int(user_ids[r]), user_ids[idxs[k][1:]], 1 / (dists[k][1:] + 1e-6))
+        for k, r in enumerate(rows)
+    ]
+
+    mismatches = 0
+    for uid, nbrs, w in cases:
+        a = legacy_top_n(ratings, user_history, nbrs, w, global_mean, uid)
+        b = sparse_top_n(data["rating_matrices"], nbrs, w, global_mean, uid)
+        mismatches += a != b
+
+    def run(fn, *state):
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for uid, nbrs, w in cases:
+                fn(*state, nbrs, w, global_mean, uid)
+            best = min(best, time.perf_counter() - start)
+        return best / len(cases)
+
+    legacy = run(legacy_top_n, ratings, user_history)
+    sparse = run(sparse_top_n, data["rating_matrices"])
+
+    print(f"users scored     : {len(cases)}")
+    print(f"top-N mismatches : {mismatches}")
+    print(f"pandas groupby   : {legacy * 1e3:8.3f} ms/request")
+    print(f"sparse CSR       : {sparse * 1e3:8.3f} ms/request")
+    print(f"speedup          : {legacy / sparse:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark: how long a new replica takes to become ready.
+
+Run from the ml/ directory:
+    python -m benchmarks.bench_startup [--runs 5] [--workers 1]
+
+Each run copies the service to a scratch directory (as bench_concurrency
+does) and times the two steps a scaled-out pod goes through:
+  init  : the k8s init container, old (train_model() every time) and new
+          (ensure_bundle(), which keeps a valid bundle)
+  serve : `uvicorn app:app` until /ml/healthz and then /ml/readyz answer
+          200, polled every 10 ms; the readyz phase timings are averaged
+Reported times are medians over --runs.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+import httpx
+import numpy as np
+
+from benchmarks.bench_concurrency import free_port, scratch_copy
+
+INIT_STEPS = {
+    "old": "from model_manager import model_manager; model_manager.train_model()",
+    "new": "from model_manager import model_manager; model_manager.ensure_bundle()",
+}
+
+def timed_init(app_dir: str, step: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", INIT_STEPS[step]], cwd=app_dir, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def timed_serve(app_dir: str, workers: int, timeout: float):
+    """Seconds to first healthz 200 and first readyz 200, plus the readyz body."""
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=app_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    live = None
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=5) as client:
+            while time.perf_counter() - start < timeout:
+                try:
+                    if live is None and client.get("/ml/healthz").status_code == 200:
+                        live = time.perf_counter() - start
+                    ready = client.get("/ml/readyz")
+                    if ready.status_code == 200:
+                        return live, time.perf_counter() - start, ready.json()
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+        raise TimeoutError("service did not become ready")
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=60)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    times = defaultdict(list)
+    phases = defaultdict(list)
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            app_dir = os.path.join(tmp, "ml")
+            scratch_copy(app_dir)
+            # first pod: whatever model_data holds is converted (or trained) once
+            timed_init(app_dir, "new")
+            times["init old"].append(timed_init(app_dir, "old"))
+            times["init new"].append(timed_init(app_dir, "new"))
+            live, ready, body = timed_serve(app_dir, args.workers, args.timeout)
+            times["serve healthz"].append(live)
+            times["serve readyz"].append(ready)
+            for name, info in body["phases"].items():
+                phases[name].append(info["seconds"])
+
+    print(f"{os.cpu_count()} cores, {args.workers} worker(s), {args.runs} runs")
+    for name, values in times.items():
+        print(f"  {name:14s}: {np.median(values):6.2f} s")
+    old = np.median(times["init old"]) + np.median(times["serve readyz"])
+    new = np.median(times["init new"]) + np.median(times["serve readyz"])
+    print(f"  pod to ready  : old init {old:6.2f} s, new init {new:6.2f} s")
+    print("  readyz phases : " + ", ".join(f"{k} {np.mean(v):.3f} s" for k, v in phases.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark: peak RSS of the training matrix build, dense pivot vs. sparse COO.
+
+Run from the ml/ directory:
+    python -m benchmarks.bench_train [--synthetic 6040 3706 1000000]
+
+Each variant runs in a fresh process so ru_maxrss is its own peak. On
+ml-100k the SVD factors of both variants are compared; --synthetic adds an
+ML-1M-sized random rating set (users, items, ratings) for the memory numbers.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy.sparse import csr_matrix
+from sklearn.decomposition import TruncatedSVD
+
+from data_manager import DATA_DIR
+from scoring import training_matrix
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def load_ratings(synthetic):
+    if synthetic is None:
+        return pd.read_csv(os.path.join(DATA_DIR, "u1.base"), sep="\t",
+                           names=["user", "item", "rating", "timestamp"],
+                           usecols=["user", "item", "rating"])
+    users, items, ratings = synthetic
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "user": rng.integers(1, users + 1, ratings),
+        "item": rng.integers(1, items + 1, ratings),
+        "rating": rng.integers(1, 6, ratings),
+    })
+    return df.drop_duplicates(["user", "item"], ignore_index=True)
+
+def dense_pivot(df):
+    """The original train_model matrix build."""
+    pivot = df.pivot(index="user", columns="item", values="rating").fillna(0)
+    return csr_matrix(pivot.values), pivot.index.to_numpy(), pivot.columns.to_numpy()
+
+def run(variant: str, synthetic, keep_factors: bool):
+    df = load_ratings(synthetic)
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    R, user_ids, item_ids = (dense_pivot if variant == "dense" else training_matrix)(df)
+    build = time.perf_counter() - start
+    svd = TruncatedSVD(n_components=50, random_state=42)
+    user_factors = svd.fit_transform(R)
+    result = {"before": before, "after": peak_rss_mb(), "build": build, "shape": R.shape}
+    if keep_factors:
+        result.update(user_ids=user_ids, item_ids=item_ids,
+                      user_factors=user_factors, components=svd.components_)
+    return result
+
+def measure(variant: str, synthetic=None, keep_factors: bool = False):
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+        return pool.submit(run, variant, synthetic, keep_factors).result()
+
+def report(label: str, results):
+    print(label)
+    for variant, r in results.items():
+        print(f"  {variant:6s}: peak RSS {r['before']:8.1f} MB -> {r['after']:8.1f} MB "
+              f"(+{r['after'] - r['before']:7.1f} MB), build {r['build'] * 1e3:8.1f} ms, shape {r['shape']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--synthetic", type=int, nargs=3, metavar=("USERS", "ITEMS", "RATINGS"),
+                        default=[6040, 3706, 1_000_000])
+    args = parser.parse_args()
+
+    small = {v: measure(v, keep_factors=True) for v in ("dense", "sparse")}
+    report("ml-100k u1.base", small)
+    a, b = small["dense"], small["sparse"]
+    same_ids = np.array_equal(a["user_ids"], b["user_ids"]) and np.array_equal(a["item_ids"], b["item_ids"])
+    print(f"  ids identical        : {same_ids}")
+    print(f"  max |user factor diff|: {np.abs(a['user_factors'] - b['user_factors']).max():.3e}")
+    print(f"  max |component diff| : {np.abs(a['components'] - b['components']).max():.3e}")
+
+    users, items, ratings = args.synthetic
+    large = {v: measure(v, synthetic=tuple(args.synthetic)) for v in ("dense", "sparse")}
+    report(f"synthetic {users} users x {items} items, {ratings} ratings", large)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import os
+import pickle
+import shutil
+import time
+import uuid
+import numpy as np
+from typing import Any, Dict, Optional
+from neighbor_index import is_exact, unfitted
+from scoring import side_info
+
+# 2: fitted scikit-learn objects replaced by plain parameters (side_info,
+# ExactIndex), so loading a bundle does not import scikit-learn
+BUNDLE_FORMAT = 2
+# Finished bundles kept under MODEL_DIR/bundles (the current one is never pruned)
+BUNDLE_KEEP = int(os.getenv("BUNDLE_KEEP", "3"))
+
+# Large arrays: one .npy each, memory-mapped read-only on load
+BUNDLE_ARRAYS = ["user_ids", "item_ids", "item_factors", "user_profiles"]
+# Small fitted objects: pickled together in manifest.pkl
+BUNDLE_OBJECTS = ["global_mean", "side_info"]
+# scikit-learn transformers kept by format 1 bundles and the legacy pickles
+SKLEARN_OBJECTS = ["svd", "scaler_age", "ohe_gender", "ohe_occupation"]
+LEGACY_ARTIFACTS = BUNDLE_ARRAYS + ["global_mean"] + SKLEARN_OBJECTS + ["nn_model"]
+
+# Versioned model bundle layout:
+#
+#   MODEL_DIR/
+#     current -> bundles/v000007        symlink, swapped atomically
+#     bundles/v000007/
+#       manifest.pkl                    format, version, small fitted parameters
+#       user_ids.npy ... user_profiles.npy, neighbors_{indices,distances}.npy
+#       top_n.npy                       optional cache, added atomically later
+#
+# A published bundle directory is never modified (apart from the top-N cache).
+# Arrays are opened with mmap_mode="r", so all worker processes and replicas
+# on a node share the same page-cache pages.
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _save_array(path: str, array: np.ndarray):
+    with open(path, "wb") as f:
+        np.save(f, np.ascontiguousarray(array))
+        f.flush()
+        os.fsync(f.fileno())
+
+def current_bundle(model_dir: str) -> Optional[str]:
+    """Directory of the published bundle, or None before the first save."""
+    link = os.path.join(model_dir, "current")
+    return os.path.realpath(link) if os.path.exists(link) else None
+
+def has_legacy_artifacts(model_dir: str) -> bool:
+    return all(os.path.exists(os.path.join(model_dir, f"{n}.pkl")) for n in LEGACY_ARTIFACTS)
+
+def _without_sklearn(objects: Dict[str, Any]) -> Dict[str, Any]:
+    """Older artifacts: replace the fitted transformers with their side_info."""
+    info = side_info(objects["scaler_age"], objects["ohe_gender"], objects["ohe_occupation"])
+    objects = {k: v for k, v in objects.items() if k not in SKLEARN_OBJECTS}
+    objects["side_info"] = info
+    if is_exact(objects["nn_model"]):
+        objects["nn_model"] = unfitted(objects["nn_model"]).fit(objects["user_profiles"])
+    return objects
+
+def load_legacy_artifacts(model_dir: str) -> Dict[str, Any]:
+    """The ten per-artifact pickles written before bundles existed."""
+    artifacts = {}
+    for name in LEGACY_ARTIFACTS:
+        with open(os.path.join(model_dir, f"{name}.pkl"), "rb") as f:
+            artifacts[name] = pickle.load(f)
+    return _without_sklearn(artifacts)
+
+# ─── Save ─────────────────────────────────────────────────────────
+def save_bundle(model_dir: str, models: Dict[str, Any]) -> str:
+    """
+    Write `models` as a new bundle version and make it current. Everything
+    is written and fsynced in a temporary directory that is renamed into
+    bundles/ and then published by swapping the `current` symlink. The new
+    directory and version are recorded on `models`.
+    """
+    bundles = os.path.join(model_dir, "bundles")
+    os.makedirs(bundles, exist_ok=True)
+    current = current_bundle(model_dir)
+    version = _read_manifest(current)["version"] + 1 if current else 1
+
+    tmp = os.path.join(bundles, f".tmp-{uuid.uuid4().hex}")
+    os.makedirs(tmp)
+    try:
+        for name in BUNDLE_ARRAYS:
+            _save_array(os.path.join(tmp, f"{name}.npy"), models[name])
+        if "all_neighbors" in models:
+            for part in ("indices", "distances"):
+                _save_array(os.path.join(tmp, f"neighbors_{part}.npy"), models["all_neighbors"][part])
+
+        # exact brute-force models only hold the profiles: store them unfitted
+        # and refit on the mapped array at load instead of pickling a copy
+        nn = models["nn_model"]
+        refit = is_exact(nn)
+        manifest = {
+            "format": BUNDLE_FORMAT,
+            "version": version,
+            "created": time.time(),
+            "objects": {name: models[name] for name in BUNDLE_OBJECTS},
+            "nn_model": unfitted(nn) if refit else nn,
+            "nn_refit": refit,
+            "fit_users": models.get("fit_users", len(models["user_ids"])),
+            "fit_time": models.get("fit_time", time.time()),
+        }
+        with open(os.path.join(tmp, "manifest.pkl"), "wb") as f:
+            pickle.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        _fsync_dir(tmp)
+
+        final = os.path.join(bundles, f"v{version:06d}")
+        os.rename(tmp, final)
+        _fsync_dir(bundles)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    link_tmp = os.path.join(model_dir, f".current-{uuid.uuid4().hex}")
+    os.symlink(os.path.relpath(final, model_dir), link_tmp)
+    os.replace(link_tmp, os.path.join(model_dir, "current"))
+    _fsync_dir(model_dir)
+    _prune(bundles, keep=final)
+    models["bundle_dir"] = final
+    models["bundle_version"] = version
+    return final
+
+def _prune(bundles: str, keep: str):
+    # open mappings of a removed bundle stay valid until the last reader unmaps it
+    finished = sorted(d for d in os.listdir(bundles) if d.startswith("v"))
+    for name in finished[:-BUNDLE_KEEP]:
+        path = os.path.join(bundles, name)
+        if path != keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+# ─── Load ─────────────────────────────────────────────────────────
+def _read_manifest(path: str) -> Dict[str, Any]:
+    with open(os.path.join(path, "manifest.pkl"), "rb") as f:
+        return pickle.load(f)
+
+def is_valid_bundle(model_dir: str) -> bool:
+    """
+    True when `current` is a complete bundle in the current format: the
+    manifest reads, and every array (including the neighbour table) is
+    present with one row per user. Array headers are read, not the data.
+    """
+    path = current_bundle(model_dir)
+    if path is None:
+        return False
+    try:
+        if _read_manifest(path)["format"] != BUNDLE_FORMAT:
+            return False
+        rows = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r").shape[0]
+            for name in BUNDLE_ARRAYS + ["neighbors_indices", "neighbors_distances"]
+        }
+    except (OSError, ValueError, KeyError, EOFError, pickle.UnpicklingError):
+        return False
+    users = rows["user_ids"]
+    return users > 0 and all(rows[name] == users for name in
+                             ("user_profiles", "neighbors_indices", "neighbors_distances"))
+
+def load_bundle(model_dir: str, mmap: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    The current bundle as a models dict (arrays memory-mapped), or None.
+    Format 1 bundles are read too; their `bundle_format` tells the caller
+    to re-save them.
+    """
+    path = current_bundle(model_dir)
+    if path is None:
+        return None
+    mode = "r" if mmap else None
+    manifest = _read_manifest(path)
+    if not 1 <= manifest["format"] <= BUNDLE_FORMAT:
+        raise ValueError(f"Unsupported model bundle format {manifest['format']} in {path}")
+
+    models: Dict[str, Any] = dict(manifest["objects"])
+    for name in BUNDLE_ARRAYS:
+        models[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+    if os.path.exists(os.path.join(path, "neighbors_indices.npy")):
+        models["all_neighbors"] = {
+            part: np.load(os.path.join(path, f"neighbors_{part}.npy"), mmap_mode=mode)
+            for part in ("indices", "distances")
+        }
+    nn = manifest["nn_model"]
+    if manifest["format"] == 1:
+        models = _without_sklearn({**models, "nn_model": nn})
+    else:
+        models["nn_model"] = nn.fit(models["user_profiles"]) if manifest["nn_refit"] else nn
+    models["bundle_format"] = manifest["format"]
+    models["fit_users"] = manifest["fit_users"]
+    models["fit_time"] = manifest["fit_time"]
+    models["bundle_dir"] = path
+    models["bundle_version"] = manifest["version"]
+    return models
+
+# ─── Top-N cache ──────────────────────────────────────────────────
+def save_top_n(bundle_dir: str, cache: Dict[int, np.ndarray], depth: int):
+    """Store the per-user top-N lists as flat arrays next to the bundle."""
+    user_ids = np.fromiter(cache.keys(), dtype=np.int64, count=len(cache))
+    lengths = np.fromiter((len(v) for v in cache.values()), dtype=np.int64, count=len(cache))
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    items = np.concatenate([np.asarray(v, dtype=np.int64) for v in cache.values()]) if cache else np.zeros(0, np.int64)
+    tmp = os.path.join(bundle_dir, f".top_n-{uuid.uuid4().hex}.npy")
+    path = os.path.join(bundle_dir, "top_n.npy")
+    # one flat int64 array: [depth, n, user ids (n), offsets (n + 1), items]
+    _save_array(tmp, np.concatenate([[depth, len(user_ids)], user_ids, offsets, items]))
+    os.replace(tmp, path)
+    _fsync_dir(bundle_dir)
+
+def load_top_n(bundle_dir: str, depth: int) -> Optional[Dict[int, np.ndarray]]:
+    """Top-N lists saved for this bundle (views into the mapped file), or None."""
+    path = os.path.join(bundle_dir, "top_n.npy")
+    if not os.path.exists(path):
+        return None
+    flat = np.load(path, mmap_mode="r")
+    if int(flat[0]) != depth:
+        return None
+    n = int(flat[1])
+    user_ids = flat[2:2 + n]
+    offsets = flat[2 + n:3 + 2 * n]
+    items = flat[3 + 2 * n:]
+    return {int(u): items[offsets[i]:offsets[i + 1]] for i, u in enumerate(user_ids)}
@@ -3,143 +3,305 @@ import pandas as pd
 from fastapi import HTTPException
 from typing import Dict, Any
 import numpy as np
-import pickle
-from filelock import FileLock
+import threading
+from locks import ResourceLock
+from metrics import FEEDBACK_WRITE_SECONDS
+from cache import LRUCache
+from user_store import UserStore
+from feedback_log import FeedbackLog
+from scoring import RatingMatrices, build_top_n_cache, TOP_N_CACHE_DEPTH
+from bundle import current_bundle, load_top_n, save_top_n
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "ml-100k")
 MODEL_DIR = os.path.join(BASE_DIR, "model_data")
 
+def build_id_index(ids: np.ndarray) -> np.ndarray:
+    """Dense id -> position lookup array; unknown ids map to -1."""
+    ids = np.asarray(ids, dtype=np.int64)
+    index = np.full(int(ids.max()) + 1 if ids.size else 0, -1, dtype=np.int64)
+    index[ids] = np.arange(ids.size)
+    return index
+
+def lookup_rows(index: np.ndarray, ids) -> np.ndarray:
+    """Vectorised lookup in a build_id_index array (-1 for unknown ids)."""
+    ids = np.asarray(ids, dtype=np.int64)
+    rows = np.full(ids.shape, -1, dtype=np.int64)
+    known = (ids >= 0) & (ids < index.size)
+    rows[known] = index[ids[known]]
+    return rows
+
+def lookup_row(index: np.ndarray, id_: int) -> int:
+    return int(index[id_]) if 0 <= id_ < index.size else -1
+
+def lookup_user_rows(M: Dict[str, Any], ids) -> np.ndarray:
+    """
+    Model rows of user ids (-1 for unknown): the fitted row from user_index,
+    or for users folded in since the fit their latest row in M["fold"].
+    """
+    rows = lookup_rows(M["user_index"], ids)
+    fold = M.get("fold")
+    if fold is not None and fold["ids"].size:
+        ids = np.asarray(ids, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(fold["ids"], ids), fold["ids"].size - 1)
+        folded = fold["ids"][pos] == ids
+        rows[folded] = fold["rows"][pos[folded]]
+    return rows
+
+def lookup_user_row(M: Dict[str, Any], user_id: int) -> int:
+    return int(lookup_user_rows(M, [user_id])[0])
+
 class DataManager:
+    """
+    Rating state and the on-disk data files.
+
+    app_state["models"] and app_state["data"] are immutable snapshots:
+    writers build a new dict and swap the reference in, so a request reads
+    each of them once and never needs a lock. Writes take the narrow lock
+    of the resource they touch, which also covers other uvicorn workers:
+      users_lock    - user-id allocation and appends to u.user
+      feedback_lock - appends to feedback.csv and merges into u1.base
+    In-process snapshot writers are serialized by _state_lock.
+    """
+
     def __init__(self):
         self.app_state = {
             "models": {},
             "data": {
-                "ratings": None,
-                "user_history": dict,
-                "all_neighbors": None,
+                "rating_matrices": None,
+                "pending_feedback": {},
+                "item_titles": {},
                 "feedback_count": 0,
-                "next_user_id": None
             }
         }
-        self.lock = FileLock(os.path.join(DATA_DIR, "data.lock"))
+        self.users_lock = ResourceLock(os.path.join(DATA_DIR, "u.user.lock"))
+        self.feedback_lock = ResourceLock(os.path.join(DATA_DIR, "feedback.lock"))
+        # u.user held in memory; the file is only appended to after the first load
+        self.users = UserStore(os.path.join(DATA_DIR, "u.user"))
+        # (age, gender, occupation) -> cold-start profile + neighbours; cleared on retrain
+        self.cold_start_cache = LRUCache(
+            maxsize=int(os.getenv("COLD_START_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("COLD_START_CACHE_TTL", "0")) or None,
+        )
+        # append-only feedback.csv; fsyncs are batched every FEEDBACK_FSYNC_INTERVAL seconds
+        self.feedback_log = FeedbackLog(
+            os.path.join(DATA_DIR, "feedback.csv"),
+            fsync_interval=float(os.getenv("FEEDBACK_FSYNC_INTERVAL", "0.05")),
+        )
+        # serialized /ml/users rows, keyed on (model version, user count)
+        self._user_export = None
+        self._recovered = False
+        # serializes building and swapping in a new app_state["data"]
+        self._state_lock = threading.Lock()
+
+    def snapshot(self):
+        """The current (models, data) snapshots; neither is mutated after publish."""
+        return self.app_state["models"], self.app_state["data"]
+
+    def _publish_data(self, **changes):
+        # caller holds _state_lock
+        self.app_state["data"] = {**self.app_state["data"], **changes}
+
+    def load_ratings(self) -> pd.DataFrame:
+        """
+        u1.base upserted with the deduped feedback log: one row per
+        (user, item), feedback winning, the same view a merge produces.
+        """
+        base_df = pd.read_csv(
+            os.path.join(DATA_DIR, "u1.base"),
+            sep="\t",
+            names=["user", "item", "rating"],
+            usecols=["user", "item", "rating"]
+        )
+        feedback_df = self.feedback_log.read()
+        combined = pd.concat([base_df, feedback_df], ignore_index=True)
+        return combined.drop_duplicates(["user", "item"], keep="last")
 
     def initialize_state(self):
-        with self.lock:
-            # Load base data
-            base_df = pd.read_csv(
-                os.path.join(DATA_DIR, "u1.base"),
-                sep="\t",
-                names=["user", "item", "rating"],
-                usecols=["user", "item", "rating"]
+        """Titles, rating state and user metadata (app startup runs the three in parallel)."""
+        self.load_titles()
+        self.load_rating_state()
+        self.load_users()
+
+    def load_titles(self):
+        # Load movie titles from u.item
+        item_path = os.path.join(DATA_DIR, "u.item")
+        try:
+            item_df = pd.read_csv(item_path, sep='|', encoding='latin-1', header=None, usecols=[0, 1], names=["item_id", "title"])
+            item_map = dict(zip(item_df["item_id"], item_df["title"]))
+        except Exception as e:
+            item_map = {}
+        with self._state_lock:
+            self._publish_data(item_titles=item_map)
+
+    def load_rating_state(self):
+        # Combine base + feedback and build the sparse scoring state
+        with self.feedback_lock, self._state_lock:
+            # Cut a torn feedback tail left by a crash on first load
+            if not self._recovered:
+                self.feedback_log.recover()
+                self._recovered = True
+            combined = self.load_ratings()
+            self._publish_data(
+                rating_matrices=RatingMatrices.from_ratings(combined),
+                pending_feedback={},
+                feedback_count=len(self.feedback_log.read(dedup=False)),
             )
-            
-            # Load movie titles from u.item
-            item_path = os.path.join(DATA_DIR, "u.item")
-            try:
-                item_df = pd.read_csv(item_path, sep='|', encoding='latin-1', header=None, usecols=[0, 1], names=["item_id", "title"])
-                item_map = dict(zip(item_df["item_id"], item_df["title"]))
-            except Exception as e:
-                item_map = {}
-            self.app_state["data"]["item_titles"] = item_map
-
-            # Load feedback data
-            feedback_path = os.path.join(DATA_DIR, "feedback.csv")
-            try:
-                feedback_df = pd.read_csv(feedback_path)
-            except FileNotFoundError:
-                feedback_df = pd.DataFrame(columns=["user", "item", "rating"])
-            
-            # Combine data
-            combined = pd.concat([base_df, feedback_df])
-            self.app_state["data"]["ratings"] = combined
-            self.app_state["data"]["user_history"] = combined.groupby("user")["item"].apply(set).to_dict()
-            
-            # ─── FIXED: Get next_user_id from u.user ──────────────────
-            user_meta_path = os.path.join(DATA_DIR, "u.user")
-            if os.path.exists(user_meta_path):
-                user_meta = pd.read_csv(
-                    user_meta_path,
-                    sep="|",
-                    names=["user_id", "age", "gender", "occupation", "zip_code"],
-                    usecols=["user_id"]
-                )
-                max_user_id = user_meta["user_id"].max()
-            else:
-                max_user_id = 0
-            
-            self.app_state["data"]["next_user_id"] = max_user_id + 1
-            # ───────────────────────────────────────────────────────────
-            
-            # Initialize feedback counter
-            self.app_state["data"]["feedback_count"] = len(feedback_df)
+
+    def load_users(self):
+        # User metadata is parsed once; create_user/user_rows pick up appends
+        if self.users.size == 0:
+            self.users.load()
+
+    def index_models(self, models: Dict[str, Any]):
+        """
+        Attach O(1) id lookups to a freshly loaded/trained model dict:
+        user id -> row of user_profiles/all_neighbors and
+        item id -> row of item_factors.
+        """
+        models["user_index"] = build_id_index(models["user_ids"])
+        models["item_index"] = build_id_index(models["item_ids"])
+        return models
+
+    def build_top_n_cache(self, models: Dict[str, Any], save: bool = False):
+        """(Re)build the per-user top-N cache for `models` and the current ratings."""
+        cache = build_top_n_cache(self.app_state["data"]["rating_matrices"], models)
+        models["top_n"] = cache
+        if save and models.get("bundle_dir"):
+            save_top_n(models["bundle_dir"], cache, TOP_N_CACHE_DEPTH)
+        return cache
+
+    def load_top_n_cache(self, models: Dict[str, Any]):
+        """
+        Map the top-N cache saved with the model bundle, rebuilding it when
+        missing or saved with a different depth.
+        """
+        if models.get("bundle_dir"):
+            cache = load_top_n(models["bundle_dir"], TOP_N_CACHE_DEPTH)
+            if cache is not None:
+                models["top_n"] = cache
+                return cache
+        return self.build_top_n_cache(models, save=True)
 
     def load_user_ids(self):
-        try:
-            with open(os.path.join(MODEL_DIR, "user_ids.pkl"), "rb") as f:
-                return pickle.load(f)
-        except FileNotFoundError:
+        path = current_bundle(MODEL_DIR)
+        if path is None:
             return np.array([])
+        return np.load(os.path.join(path, "user_ids.npy"), mmap_mode="r")
 
-    def get_next_user_id(self):
-        with self.lock:
-            next_id = self.app_state["data"]["next_user_id"]
-            self.app_state["data"]["next_user_id"] += 1
-            return next_id
+    def user_export(self):
+        """
+        (user ids, updated times, one JSON object per user) for /ml/users,
+        all sorted by id. Serialized in one pass and reused until the model
+        version changes or a user is added (here or, via refresh(), by
+        another worker).
+        """
+        self.users.refresh()
+        key = (self.app_state["models"].get("version"), self.users.size)
+        export = self._user_export
+        if export is None or export[0] != key:
+            frame = self.users.export_frame()
+            lines = frame.drop(columns="updated").to_json(orient="records", lines=True)
+            export = (key, frame["user_id"].to_numpy(), frame["updated"].to_numpy(),
+                      np.array(lines.splitlines(), dtype=object))
+            self._user_export = export
+        return export[1:]
 
-    def add_feedback(self, user_id: int, item_id: int, rating: float):
-        feedback_path = os.path.join(DATA_DIR, "feedback.csv")
-        with self.lock:
-            # load or create feedback.csv
-            existing = pd.read_csv(feedback_path) \
-                    if os.path.exists(feedback_path) else pd.DataFrame(columns=["user","item","rating"])
-            mask = (existing["user"] == user_id) & (existing["item"] == item_id)
+    def create_user(self, age: int, gender: str, occupation: str, zip_code: str = "00000") -> int:
+        """Allocate the next id and record the user on disk and in memory."""
+        with self.users_lock:
+            # other workers may have appended since we last looked
+            self.users.refresh()
+            user_id = self.users.max_user_id() + 1
+            self.users.append(user_id, age, gender, occupation, zip_code)
+            return user_id
 
-            if mask.any():
-                existing.loc[mask, "rating"] = rating
-            else:
-                new_row = pd.DataFrame([[user_id, item_id, rating]], columns=["user", "item", "rating"])
-                existing = pd.concat([existing, new_row], ignore_index=True)
+    def user_rows(self, user_ids) -> pd.DataFrame:
+        """UserStore.rows, re-reading u.user once if another worker added an id."""
+        meta = self.users.rows(user_ids)
+        if len(meta) < len(set(user_ids)) and self.users.refresh():
+            meta = self.users.rows(user_ids)
+        return meta
 
-            # persist every single feedback
-            existing.to_csv(feedback_path, index=False)
+    def add_feedback(self, user_id: int, item_id: int, rating: float):
+        with FEEDBACK_WRITE_SECONDS.time():
+            self._add_feedback(user_id, item_id, rating)
 
-            # just count it—no in-RAM cache touch here
-            self.app_state["data"]["feedback_count"] += 1
+    def _add_feedback(self, user_id: int, item_id: int, rating: float):
+        # one appended line per rating; re-ratings are deduped when the log is read
+        with self.feedback_lock:
+            self.feedback_log.append(user_id, item_id, rating)
 
+        # apply it to the live rating state: a new snapshot with the pending
+        # overlay rebuilt, swapped in so readers see it on their next request
+        with self._state_lock:
+            data = self.app_state["data"]
+            pending = {**data["pending_feedback"], (int(user_id), int(item_id)): float(rating)}
+            self._publish_data(
+                pending_feedback=pending,
+                rating_matrices=data["rating_matrices"].with_feedback(pending),
+                feedback_count=data["feedback_count"] + 1,
+            )
+        # the published top-N cache is left alone: cached_top_n drops items
+        # the user has rated since from the live rating_matrices
 
-    def _merge_feedback_into_base(self):
-        """Load u1.base + feedback.csv → merge/update → overwrite u1.base → delete feedback.csv."""
+    def _merge_feedback_into_base(self) -> pd.DataFrame:
+        """
+        Upsert the deduped feedback log into u1.base keyed on (user, item),
+        then delete the log. The new base is written to a temp file and
+        atomically renamed, so a crash never leaves u1.base truncated; a
+        crash before the log is cleared just re-applies the same upsert.
+        Returns the rows of the new u1.base.
+        """
         base_path = os.path.join(DATA_DIR, "u1.base")
-        fb_path   = os.path.join(DATA_DIR, "feedback.csv")
 
         # 1) read the original base
         base_df = pd.read_csv(
             base_path,
             sep="\t",
             names=["user","item","rating","timestamp"],
-            usecols=["user","item","rating"]
         )
 
-        # 2) read every buffered feedback
-        fb_df = pd.read_csv(fb_path)
+        # 2) read every buffered feedback (last write per user/item wins)
+        fb_df = self.feedback_log.read()
+        if fb_df.empty:
+            self.feedback_log.clear()
+            return base_df
+
+        # 3) key-based upsert: every base row of a (user,item) takes the new
+        #    rating, pairs missing from the base are appended
+        now = int(pd.Timestamp.now().timestamp())
+        n_items = int(max(base_df["item"].max(), fb_df["item"].max())) + 1
+        base_key = base_df["user"].to_numpy(dtype=np.int64) * n_items + base_df["item"].to_numpy()
+        fb_key = fb_df["user"].to_numpy(dtype=np.int64) * n_items + fb_df["item"].to_numpy()
 
-        # 3) for each (user,item) in fb_df, update or append
-        for u,i,r in fb_df.itertuples(index=False):
-            mask = (base_df["user"] == u) & (base_df["item"] == i)
-            if mask.any():
-                base_df.loc[mask, "rating"] = r
-            else:
-                base_df = pd.concat([
-                    base_df,
-                    pd.DataFrame([[u,i,r]], columns=["user","item","rating"])
-                ], ignore_index=True)
+        pos = pd.Index(fb_key).get_indexer(base_key)
+        hit = pos >= 0
+        rating = base_df["rating"].to_numpy(dtype=np.float64, copy=True)
+        rating[hit] = fb_df["rating"].to_numpy()[pos[hit]]
+        timestamp = base_df["timestamp"].fillna(now).to_numpy(dtype=np.int64, copy=True)
+        timestamp[hit] = now
+        base_df = base_df.assign(rating=rating, timestamp=timestamp)
 
-        # 4) overwrite u1.base (tab-sep, no header)
-        base_df.to_csv(base_path, sep="\t", header=False, index=False)
+        new_rows = fb_df[~np.isin(fb_key, base_key)].assign(timestamp=now)
+        merged = pd.concat([base_df, new_rows], ignore_index=True)
+
+        # 4) write the new u1.base (tab-sep, no header) next to the old one and swap
+        tmp_path = f"{base_path}.tmp"
+        with open(tmp_path, "w") as f:
+            merged.to_csv(f, sep="\t", header=False, index=False, float_format="%g")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, base_path)
+        dir_fd = os.open(DATA_DIR, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
 
         # 5) clear out feedback.csv
-        os.remove(fb_path)
+        self.feedback_log.clear()
+        return merged
 
     # def check_retrain_needed(self, threshold: int = 100):
     #     with self.lock:
@@ -153,18 +315,25 @@ class DataManager:
         Once feedback_count ≥ threshold:
         • merge ALL feedback into u1.base
         • clear the CSV buffer
-        • reset the counter + re-init in-RAM data
+        • rebuild the base matrices from the merged file, which also holds
+          feedback other workers appended to the shared log
+        • reset the counter
         • return True so caller can retrain
         """
-        if self.app_state["data"]["feedback_count"] >= threshold:
-            with self.lock:
-                self._merge_feedback_into_base()
-                # reload everything off the newly updated base
-                self.initialize_state()
-                # reset
-                self.app_state["data"]["feedback_count"] = 0
-            return True
-        return False
+        if self.app_state["data"]["feedback_count"] < threshold:
+            return False
+        with self.feedback_lock, self._state_lock:
+            data = self.app_state["data"]
+            if data["feedback_count"] < threshold:
+                return False  # merged by a concurrent request
+            merged = self._merge_feedback_into_base()
+            self._publish_data(
+                rating_matrices=RatingMatrices.from_ratings(
+                    merged.drop_duplicates(["user", "item"], keep="last")),
+                pending_feedback={},
+                feedback_count=0,
+            )
+        return True
 
 
 data_manager = DataManager()
\ No newline at end of file
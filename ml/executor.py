@@ -0,0 +1,75 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+# Threads running CPU-bound scoring (NumPy/SciPy release the GIL in the hot
+# loops, and the models are shared in memory, so threads rather than
+# processes). Size it to the container's CPU limit so a saturated pool shows
+# up as CPU utilization for the HPA.
+WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", str(os.cpu_count() or 1)))
+# Scoring jobs allowed to wait for a thread; beyond that requests get a 429
+WORKER_QUEUE_DEPTH = int(os.getenv("WORKER_QUEUE_DEPTH", str(4 * WORKER_POOL_SIZE)))
+# Threads for blocking file I/O (feedback appends, exports, u.user writes)
+IO_POOL_SIZE = int(os.getenv("IO_POOL_SIZE", "8"))
+
+class Saturated(Exception):
+    """The scoring pool and its queue are full."""
+
+class ExecutionLayer:
+    """
+    Keeps blocking work off the asyncio loop. run_cpu() sends scoring to a
+    bounded thread pool and rejects work with Saturated once WORKER_POOL_SIZE
+    jobs are running and WORKER_QUEUE_DEPTH more are waiting, instead of
+    letting the backlog (and every request's latency) grow without bound.
+    run_io() hands blocking file I/O to a separate pool so a slow disk never
+    holds up scoring threads.
+    """
+
+    def __init__(self, pool_size: int = WORKER_POOL_SIZE, queue_depth: int = WORKER_QUEUE_DEPTH,
+                 io_pool_size: int = IO_POOL_SIZE):
+        self.pool_size = pool_size
+        self.capacity = pool_size + queue_depth
+        self._cpu = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="score")
+        self._io = ThreadPoolExecutor(max_workers=io_pool_size, thread_name_prefix="io")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.rejected = 0
+        self.completed = 0
+
+    async def run_cpu(self, fn: Callable, *args) -> Any:
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self.rejected += 1
+                raise Saturated(f"{self._in_flight} scoring jobs in flight")
+            self._in_flight += 1
+        # the slot is freed when the thread finishes, even if the awaiting
+        # request was cancelled in the meantime
+        future = self._cpu.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+            self.completed += 1
+
+    async def run_io(self, fn: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._io, fn, *args)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "pool_size": self.pool_size,
+                "capacity": self.capacity,
+                "in_flight": self._in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        self._cpu.shutdown(wait=False, cancel_futures=True)
+        self._io.shutdown(wait=True)
+
+executor = ExecutionLayer()
@@ -0,0 +1,141 @@
+import os
+import threading
+import pandas as pd
+from typing import Optional
+
+FEEDBACK_HEADER = "user,item,rating\n"
+
+class FeedbackLog:
+    """
+    Append-only, line-oriented feedback log (the feedback.csv format).
+
+    Every rating is one `user,item,rating` line written with a single
+    O_APPEND write, so it is in the OS page cache as soon as append()
+    returns and survives a process crash. fsync is batched: a background
+    thread syncs at most every `fsync_interval` seconds (0 = fsync on every
+    append), bounding what a power loss can take. Re-rating an item just
+    appends a new line; read() keeps the last line per (user, item).
+    """
+
+    def __init__(self, path: str, fsync_interval: float = 0.05):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.lock = threading.RLock()
+        self._fd: Optional[int] = None
+        self._inode = None
+        self._dirty = False
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # ─── Recovery ────────────────────────────────────────────────────
+    def recover(self) -> int:
+        """
+        Make the file safe to append to after a crash: a torn (newline-less)
+        last line is cut off and a missing header is written back.
+        Returns the number of bytes dropped.
+        """
+        with self.lock:
+            self._close_fd()
+            if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+                return 0
+            with open(self.path, "rb+") as f:
+                size = f.seek(0, os.SEEK_END)
+                tail_start = max(0, size - 4096)
+                while True:
+                    f.seek(tail_start)
+                    chunk = f.read(size - tail_start)
+                    cut = chunk.rfind(b"\n")
+                    if cut >= 0 or tail_start == 0:
+                        break
+                    tail_start = max(0, tail_start - 4096)
+                keep = tail_start + cut + 1 if cut >= 0 else 0
+                if keep < size:
+                    f.truncate(keep)
+                    f.flush()
+                    os.fsync(f.fileno())
+                return size - keep
+
+    # ─── Writes ──────────────────────────────────────────────────────
+    def _open_fd(self):
+        # reopen if the log was rotated away underneath us (merge, other worker)
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if self._fd is None or inode != self._inode:
+            self._close_fd()
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            if os.fstat(self._fd).st_size == 0:
+                os.write(self._fd, FEEDBACK_HEADER.encode())
+            self._inode = os.fstat(self._fd).st_ino
+        return self._fd
+
+    def _close_fd(self):
+        if self._fd is not None:
+            if self._dirty:
+                os.fsync(self._fd)
+                self._dirty = False
+            os.close(self._fd)
+            self._fd = None
+            self._inode = None
+
+    def append(self, user_id: int, item_id: int, rating: float):
+        line = f"{int(user_id)},{int(item_id)},{float(rating)}\n".encode()
+        with self.lock:
+            fd = self._open_fd()
+            os.write(fd, line)
+            if self.fsync_interval <= 0:
+                os.fsync(fd)
+            else:
+                self._dirty = True
+                self._start_flusher()
+
+    def sync(self):
+        """Force any batched appends to stable storage."""
+        with self.lock:
+            if self._fd is not None and self._dirty:
+                os.fsync(self._fd)
+                self._dirty = False
+
+    def _start_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._stop.clear()
+            self._flusher = threading.Thread(target=self._flush_loop, name="feedback-fsync", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.fsync_interval):
+            self.sync()
+
+    def close(self):
+        self._stop.set()
+        with self.lock:
+            self._close_fd()
+
+    def clear(self):
+        """Drop the log once its contents have been merged into the base file."""
+        with self.lock:
+            self._close_fd()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    # ─── Reads ───────────────────────────────────────────────────────
+    def read(self, dedup: bool = True) -> pd.DataFrame:
+        """All logged ratings; with dedup the last line per (user, item) wins."""
+        with self.lock:
+            try:
+                df = pd.read_csv(
+                    self.path,
+                    usecols=["user", "item", "rating"],
+                    dtype={"user": "int64", "item": "int64", "rating": "float64"},
+                    on_bad_lines="skip",
+                )
+            except (FileNotFoundError, pd.errors.EmptyDataError):
+                df = pd.DataFrame({
+                    "user": pd.Series(dtype="int64"),
+                    "item": pd.Series(dtype="int64"),
+                    "rating": pd.Series(dtype="float64"),
+                })
+        if dedup:
+            df = df.drop_duplicates(["user", "item"], keep="last").reset_index(drop=True)
+        return df
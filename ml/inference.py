@@ -1,8 +1,15 @@
 import os
-import pickle
 import numpy as np
 import pandas as pd
-from typing import List
+from typing import Any, Dict, List, Optional, Sequence
+from data_manager import build_id_index, lookup_rows
+from bundle import load_bundle, load_legacy_artifacts
+from feedback_log import FeedbackLog
+from user_store import UserStore
+from scoring import (
+    RatingMatrices, cold_start_profiles, query_neighbors,
+    score_items_batch, table_neighbors, top_n_batch
+)
 
 BASE_DIR      = os.path.dirname(os.path.abspath(__file__))
 MODEL_DIR     = os.path.join(BASE_DIR, "model_data")
@@ -10,100 +17,127 @@ RATINGS_FILE  = os.path.join(BASE_DIR, "ml-100k", "u1.base")
 FEEDBACK_FILE = os.path.join(BASE_DIR, "ml-100k", "feedback.csv")
 USER_META     = os.path.join(BASE_DIR, "ml-100k", "u.user")
 
-def load_model_components():
-    names = [
-        "user_ids", "item_ids", "item_factors",
-        "user_profiles", "nn_model", "global_mean",
-        "svd", "scaler_age", "ohe_gender", "ohe_occupation"
-    ]
-    components = {}
-    for name in names:
-        path = os.path.join(MODEL_DIR, f"{name}.pkl")
-        with open(path, "rb") as f:
-            components[name] = pickle.load(f)
+def load_model_components(model_dir: str = MODEL_DIR):
+    # memory-mapped bundle; fall back to the pre-bundle pickles
+    components = load_bundle(model_dir)
+    if components is None:
+        components = load_legacy_artifacts(model_dir)
     return components
 
-def recommend(user_id: int, top_n: int = 10) -> List[int]:
-    # Load all model artifacts + transformers
-    model = load_model_components()
-
-    # Load & combine base + feedback ratings
-    try:
-        fb = pd.read_csv(FEEDBACK_FILE, names=["user", "item", "rating"])
-    except FileNotFoundError:
-        fb = pd.DataFrame(columns=["user", "item", "rating"])
+def load_ratings(ratings_file: str = RATINGS_FILE, feedback_file: Optional[str] = FEEDBACK_FILE) -> pd.DataFrame:
+    """Base ratings upserted with the feedback log (last rating per (user, item) wins)."""
     base = pd.read_csv(
-        RATINGS_FILE,
+        ratings_file,
         sep="\t",
         names=["user", "item", "rating", "timestamp"],
         usecols=["user", "item", "rating"]
     )
-    ratings = pd.concat([base, fb], ignore_index=True)
-
-    # Helper to compute neighbors & weights given a profile vector
-    def get_neighbors(profile: np.ndarray):
-        dists, idxs = model["nn_model"].kneighbors([profile])
-        neigh_i = idxs[0][1:]  # skip self
-        w = 1 / (dists[0][1:] + 1e-6)
-        users = model["user_ids"][neigh_i]
-        return users, w
-
-    # ─── Cold-start branch ─────────────────────────────────────────────────────────
-    if user_id not in model["user_ids"]:
-        # 1. load this user's metadata
-        meta = pd.read_csv(
-            USER_META,
-            sep="|",
-            names=["user_id","age","gender","occupation","zip_code"]
-        ).set_index("user_id")
-        if user_id not in meta.index:
-            return []  # no metadata → no recs
-
-        row = meta.loc[user_id]
-        # 2. transform side-info
-        age_scaled      = model["scaler"].transform([[row.age]])
-        gender_feat     = model["ohe_gender"].transform([[row.gender]])
-        occupation_feat = model["ohe_occupation"].transform([[row.occupation]])
-        # 3. zero-vector for latent factors
-        zeros = np.zeros(model["svd"].n_components)
-        profile = np.hstack([zeros, age_scaled, gender_feat, occupation_feat])
-
-        neighbor_users, neighbor_weights = get_neighbors(profile)
-
-    # ─── Existing-user branch ───────────────────────────────────────────────────────
-    else:
-        # locate index in the trained user_profiles
-        uidx = np.where(model["user_ids"] == user_id)[0][0]
-        profile = model["user_profiles"][uidx]
-        neighbor_users, neighbor_weights = get_neighbors(profile)
-
-    # ─── Scoring ────────────────────────────────────────────────────────────────────
-    # Filter neighbors' ratings
-    nbr_r = ratings[ratings["user"].isin(neighbor_users)]
-    if nbr_r.empty:
-        return []
-
-    # Compute weighted scores per item
-    weight_map = dict(zip(neighbor_users, neighbor_weights))
-    item_accum = {}  # item_id -> [weighted_scores...]
-
-    for _, row in nbr_r.iterrows():
-        item = row.item
-        score = weight_map[row.user] * row.rating
-        item_accum.setdefault(item, []).append(score)
-
-    # Build final predictions
-    preds = {}
-    for item, scores in item_accum.items():
-        # total weight of neighbors who rated this item
-        users_who_rated = nbr_r[nbr_r["item"] == item]["user"]
-        total_w = sum(weight_map[u] for u in users_who_rated if u in weight_map)
-        preds[item] = (sum(scores) / total_w) + model["global_mean"]
-
-    # Exclude items the user has already seen
-    seen = set(ratings[ratings["user"] == user_id]["item"].unique())
-    candidates = [(it, sc) for it, sc in preds.items() if it not in seen]
-
-    # Return top-N item IDs
-    top_items = sorted(candidates, key=lambda x: x[1], reverse=True)[:top_n]
-    return [int(item) for item, _ in top_items]
+    frames = [base]
+    if feedback_file:
+        frames.append(FeedbackLog(feedback_file).read())
+    ratings = pd.concat(frames, ignore_index=True)
+    return ratings.drop_duplicates(["user", "item"], keep="last")
+
+class Recommender:
+    """
+    Offline recommender over a model bundle. Artifacts, ratings and user
+    metadata are loaded once; every call goes through the same sparse
+    scoring path as the API (scoring.top_n_batch), many users at a time.
+
+    `models` / `ratings` / `users` can be passed in directly (e.g. a model
+    just fitted on an evaluation split) instead of being read from disk.
+    """
+
+    def __init__(self, models: Optional[Dict[str, Any]] = None,
+                 ratings: Optional[pd.DataFrame] = None,
+                 users: Optional[UserStore] = None,
+                 model_dir: str = MODEL_DIR,
+                 ratings_file: str = RATINGS_FILE,
+                 feedback_file: Optional[str] = FEEDBACK_FILE,
+                 user_meta: str = USER_META):
+        self.models = models if models is not None else load_model_components(model_dir)
+        self.models.setdefault("user_index", build_id_index(self.models["user_ids"]))
+        self.global_mean = float(self.models["global_mean"])
+
+        if ratings is None:
+            ratings = load_ratings(ratings_file, feedback_file)
+        self.matrices = RatingMatrices.from_ratings(ratings)
+
+        if users is None:
+            users = UserStore(user_meta)
+            users.load()
+        self.users = users
+
+    def _neighbors(self, user_ids: np.ndarray):
+        """Neighbours/weights per user, plus a mask of users that have any."""
+        M = self.models
+        k = M["nn_model"].n_neighbors - 1
+        neighbors = np.zeros((len(user_ids), k), dtype=np.int64)
+        weights = np.zeros((len(user_ids), k))
+
+        rows = lookup_rows(M["user_index"], user_ids)
+        warm = np.flatnonzero(rows >= 0)
+        if warm.size:
+            if "all_neighbors" in M:
+                neighbors[warm], weights[warm] = table_neighbors(M, rows[warm])
+            else:
+                neighbors[warm], weights[warm] = query_neighbors(M, M["user_profiles"][rows[warm]])
+
+        # cold-start users are placed by their metadata alone
+        found = rows >= 0
+        cold = np.flatnonzero(rows < 0)
+        meta = self.users.rows(user_ids[cold])
+        if not meta.empty:
+            cold = cold[np.isin(user_ids[cold], meta.index)]
+            neighbors[cold], weights[cold] = query_neighbors(M, cold_start_profiles(M, meta.loc[user_ids[cold]]))
+            found[cold] = True
+        return neighbors, weights, found
+
+    def recommend_batch(self, user_ids: Sequence[int], top_n: int = 10) -> List[List[int]]:
+        """Top-N item ids for each user (empty for unknown users without metadata)."""
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        results: List[List[int]] = [[] for _ in range(len(user_ids))]
+        if not user_ids.size:
+            return results
+        neighbors, weights, found = self._neighbors(user_ids)
+        scored = np.flatnonzero(found)
+        tops = top_n_batch(self.matrices, neighbors[scored], weights[scored],
+                           self.global_mean, user_ids[scored], n=top_n)
+        for row, items in zip(scored, tops):
+            results[row] = [int(i) for i in items]
+        return results
+
+    def recommend(self, user_id: int, top_n: int = 10) -> List[int]:
+        return self.recommend_batch([user_id], top_n)[0]
+
+    def predict(self, user_ids: Sequence[int], item_ids: Sequence[int],
+                chunk_size: int = 512) -> np.ndarray:
+        """
+        Rating estimates for (user, item) pairs: the neighbour-weighted mean
+        rating of the item (the ranking score without its global-mean
+        offset), or the global mean where no neighbour rated it.
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        preds = np.full(len(user_ids), self.global_mean)
+        users, inverse = np.unique(user_ids, return_inverse=True)
+        neighbors, weights, found = self._neighbors(users)
+        in_range = (item_ids >= 0) & (item_ids < self.matrices.shape[1])
+
+        for start in range(0, len(users), chunk_size):
+            stop = min(start + chunk_size, len(users))
+            pred, candidates = score_items_batch(self.matrices, neighbors[start:stop],
+                                                 weights[start:stop], self.global_mean)
+            pairs = np.flatnonzero((inverse >= start) & (inverse < stop) & in_range & found[inverse])
+            rows, cols = inverse[pairs] - start, item_ids[pairs]
+            preds[pairs] = np.where(candidates[rows, cols], pred[rows, cols] - self.global_mean, self.global_mean)
+        return np.clip(preds, 1.0, 5.0)
+
+_default: Optional[Recommender] = None
+
+def recommend(user_id: int, top_n: int = 10) -> List[int]:
+    """Top-N for one user from the saved bundle (artifacts are loaded on first call)."""
+    global _default
+    if _default is None:
+        _default = Recommender()
+    return _default.recommend(user_id, top_n)
@@ -0,0 +1,31 @@
+import os
+import threading
+from filelock import FileLock
+
+class ResourceLock:
+    """
+    Writer lock for one on-disk resource (the user log, the feedback log,
+    the model bundle directory). Exclusive between the threads of this
+    process and, through an flock on `path`, between uvicorn workers.
+    Readers never take it: they work off the immutable snapshots published
+    in DataManager.app_state or off files that are only replaced atomically.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file_lock = FileLock(path)
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file_lock.acquire()
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self._file_lock.release()
+        self._thread_lock.release()
@@ -0,0 +1,164 @@
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from typing import List, Optional
+
+from metrics import LOG_RECORDS
+
+# Records buffered between the request path and the shipping thread
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Records written per handler call, and how long the shipper waits to fill a batch
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.25"))
+# Fraction of per-request INFO records kept (warnings and errors are always kept)
+LOG_INFO_SAMPLE_RATE = float(os.getenv("LOG_INFO_SAMPLE_RATE", "1.0"))
+
+# Logging pipeline:
+#
+#   logger.info(...) --> SampleFilter --> DroppingQueueHandler --> bounded queue
+#                                                                      |
+#   Logstash (TCP), stdout  <-- one write per batch <-- BatchingListener thread
+#
+# The request thread only copies the record onto the queue. Formatting and
+# socket writes happen on the listener thread, so a slow or unreachable
+# Logstash can fill the queue but never stalls a request: once the queue is
+# full new records are dropped and counted.
+
+class SampleFilter(logging.Filter):
+    """Keep a `rate` fraction of INFO-and-below records; always keep warnings."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or self.rate >= 1 or random.random() < self.rate:
+            return True
+        LOG_RECORDS.inc(outcome="sampled_out")
+        return False
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            LOG_RECORDS.inc(outcome="queued")
+        except queue.Full:
+            self.dropped += 1
+            LOG_RECORDS.inc(outcome="dropped")
+
+class BatchingListener:
+    """
+    Drains the log queue on a daemon thread and hands records to the real
+    handlers in batches: up to `batch_size` records, or whatever arrived
+    within `flush_interval` of the first one. Socket handlers get one send
+    per batch and stream handlers one write and flush per batch.
+    """
+
+    _STOP = object()
+
+    def __init__(self, log_queue: queue.Queue, handlers: List[logging.Handler],
+                 batch_size: int = LOG_BATCH_SIZE, flush_interval: float = LOG_FLUSH_INTERVAL,
+                 drop_source: Optional[DroppingQueueHandler] = None):
+        self.queue = log_queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_source = drop_source
+        self._reported_drops = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="log-shipper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Flush what is queued and stop the thread."""
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is self._STOP:
+                return
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is self._STOP:
+                    stop = True
+                    break
+                batch.append(record)
+            self._report_drops(batch)
+            self.emit_batch(batch)
+            if stop:
+                return
+
+    def _report_drops(self, batch: List[logging.LogRecord]):
+        if self.drop_source is None:
+            return
+        dropped = self.drop_source.dropped
+        if dropped > self._reported_drops:
+            batch.append(logging.makeLogRecord({
+                "name": "MLServiceLogger", "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": f"Log queue full, dropped {dropped - self._reported_drops} records",
+            }))
+            self._reported_drops = dropped
+
+    def emit_batch(self, records: List[logging.LogRecord]):
+        for handler in self.handlers:
+            accepted = [r for r in records if r.levelno >= handler.level and handler.filter(r)]
+            if not accepted:
+                continue
+            try:
+                if isinstance(handler, logging.handlers.SocketHandler):
+                    data = b"".join(handler.makePickle(r) for r in accepted)
+                    with handler.lock:
+                        handler.send(data)
+                elif isinstance(handler, logging.StreamHandler):
+                    text = "".join(handler.format(r) + handler.terminator for r in accepted)
+                    with handler.lock:
+                        handler.stream.write(text)
+                        handler.flush()
+                else:
+                    for r in accepted:
+                        handler.handle(r)
+            except Exception:
+                handler.handleError(accepted[0])
+
+def start_pipeline(logger: logging.Logger, handlers: List[logging.Handler],
+                   queue_size: int = LOG_QUEUE_SIZE,
+                   sample_rate: float = LOG_INFO_SAMPLE_RATE) -> BatchingListener:
+    """
+    Route `logger` through a bounded queue to `handlers` and start shipping.
+    Per-request INFO logs go to the `<logger>.requests` child logger, which
+    is the one sampled at `sample_rate`.
+    """
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    logger.addHandler(queue_handler)
+    logging.getLogger(f"{logger.name}.requests").addFilter(SampleFilter(sample_rate))
+
+    listener = BatchingListener(log_queue, handlers, drop_source=queue_handler)
+    listener.start()
+    return listener
@@ -1,111 +1,469 @@
 import os
-import pickle
+import logging
+import threading
+import time
 import numpy as np
 import pandas as pd
-from sklearn.decomposition import TruncatedSVD
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from collections import ChainMap
 from scipy.sparse import csr_matrix
-from sklearn.neighbors import NearestNeighbors
-from data_manager import DATA_DIR, MODEL_DIR, data_manager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable
+from data_manager import DATA_DIR, MODEL_DIR, data_manager, lookup_rows, lookup_user_rows
+from locks import ResourceLock
+from metrics import TRAIN_PHASE_SECONDS, TRAIN_SECONDS
+from neighbor_index import RowBuffer, build_neighbor_index, neighbor_table
+from bundle import (
+    BUNDLE_FORMAT, current_bundle, has_legacy_artifacts, is_valid_bundle,
+    load_bundle, load_legacy_artifacts, save_bundle
+)
+from scoring import TOP_N_CACHE_DEPTH, side_features, side_info, table_neighbors, top_n_batch, training_matrix
+
+logger = logging.getLogger("MLServiceLogger")
+
+# Full refit once folded-in users exceed this fraction of the fitted users,
+# or once the last full fit is older than FULL_RETRAIN_INTERVAL seconds (0 = never)
+FOLD_IN_DRIFT_THRESHOLD = float(os.getenv("FOLD_IN_DRIFT_THRESHOLD", "0.05"))
+FULL_RETRAIN_INTERVAL = float(os.getenv("FULL_RETRAIN_INTERVAL", "86400"))
+# Minimum seconds between fold-ins; users queued meanwhile are folded in one batch
+FOLD_IN_INTERVAL = float(os.getenv("FOLD_IN_INTERVAL", "1"))
+
+def fit_models(combined: pd.DataFrame, user_meta: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Fit SVD factors, side-info transformers and the neighbour model on
+    (user, item, rating) rows with one row per pair. `user_meta` is indexed
+    by user_id; users without metadata get the most common values.
+    """
+    # scikit-learn is only needed to fit; serving processes never import it
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+    user_meta = user_meta.copy()
+
+    # Sparse user×item matrix (same layout as the old dense pivot)
+    with TRAIN_PHASE_SECONDS.time(phase="matrix"):
+        R, user_ids, item_ids = training_matrix(combined)
+    
+    # SVD decomposition
+    with TRAIN_PHASE_SECONDS.time(phase="svd"):
+        svd = TruncatedSVD(n_components=50, random_state=42)
+        user_factors = svd.fit_transform(R)
+
+    # Add missing users and reindex
+    missing_users = set(user_ids) - set(user_meta.index)
+    default_age = int(round(user_meta["age"].mean()))
+    default_gender = user_meta["gender"].mode()[0]
+    default_occupation = user_meta["occupation"].mode()[0]
+    
+    for uid in missing_users:
+        user_meta.loc[uid] = [default_age, default_gender, default_occupation, "00000"]
+    
+    # Ensure metadata alignment with the matrix rows
+    user_meta = user_meta.reindex(user_ids)
+
+    # Feature engineering
+    scaler_age = StandardScaler()  # Assign the scaler to a variable
+    age_scaled = scaler_age.fit_transform(user_meta[["age"]])
+
+    ohe_gender = OneHotEncoder(sparse_output=False, handle_unknown="ignore")
+    gender_feats = ohe_gender.fit_transform(user_meta[["gender"]])
+
+    ohe_occupation = OneHotEncoder(sparse_output=False, handle_unknown="ignore")
+    occ_feats = ohe_occupation.fit_transform(user_meta[["occupation"]])
+    
+    # Ensure dimensional alignment
+    user_profiles = np.hstack([
+        user_factors,
+        age_scaled,
+        gender_feats,
+        occ_feats
+    ])
+
+    # Model training
+    with TRAIN_PHASE_SECONDS.time(phase="nn_fit"):
+        nn = build_neighbor_index(n_neighbors=50)
+        nn.fit(user_profiles)
+
+    return {
+        "user_ids": user_ids,
+        "item_ids": item_ids,
+        "item_factors": svd.components_.T,
+        "user_profiles": user_profiles,
+        "global_mean": combined["rating"].mean(),
+        "nn_model": nn,
+        "side_info": side_info(scaler_age, ohe_gender, ohe_occupation),
+    }
 
 class ModelManager:
+    """
+    Trains model bundles and swaps them into data_manager.app_state["models"].
+
+    A bundle is built completely off to the side (artifacts, neighbour table,
+    id indexes, top-N cache) and then published with a single reference
+    assignment, so in-flight requests keep the bundle they started with.
+    request_retrain() runs training on a single background worker; triggers
+    that arrive while a run is in progress are coalesced into one follow-up.
+    request_fold_in() projects new/updated users onto the existing SVD
+    components on the same worker, so fold-ins and full fits never overlap.
+    """
+
     def __init__(self):
-        self.lock = data_manager.lock
+        # bundle saves (version numbering, symlink swap, pruning) across workers
+        self.bundle_lock = ResourceLock(os.path.join(MODEL_DIR, "bundle.lock"))
+        self.version = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrain")
+        self._status_lock = threading.Lock()
+        self._running = False
+        self._pending = False
+        self._fold_users = set()
+        self._fold_scheduled = False
+        self._last_fold_in = 0.0
+        self.status: Dict[str, Any] = {
+            "state": "idle",
+            "version": 0,
+            "bundle_version": None,
+            "last_started": None,
+            "last_finished": None,
+            "last_duration": None,
+            "last_error": None,
+            "runs": 0,
+            "coalesced": 0,
+            "fold_ins": 0,
+            "folded_users": 0,
+            "drift": 0.0,
+        }
 
-    def train_model(self):
-        with self.lock:
-            # Load and prepare data
-            base_df = pd.read_csv(
-                os.path.join(DATA_DIR, "u1.base"),
-                sep="\t",
-                names=["user", "item", "rating"],
-                usecols=["user", "item", "rating"]
-            )
-            
-            try:
-                feedback_df = pd.read_csv(
-                    os.path.join(DATA_DIR, "feedback.csv"),
+    # ─── Training ────────────────────────────────────────────────────
+    def _fit(self) -> Dict[str, Any]:
+        # Load and prepare data (only the file snapshot needs the lock)
+        with TRAIN_PHASE_SECONDS.time(phase="load"):
+            with data_manager.feedback_lock:
+                base_df = pd.read_csv(
+                    os.path.join(DATA_DIR, "u1.base"),
+                    sep="\t",
+                    names=["user", "item", "rating"],
                     usecols=["user", "item", "rating"]
                 )
-            except FileNotFoundError:
-                feedback_df = pd.DataFrame(columns=["user", "item", "rating"])
+                feedback_df = data_manager.feedback_log.read()
             
             combined = pd.concat([base_df, feedback_df], ignore_index=True)
             combined = combined.groupby(["user", "item"], as_index=False)["rating"].mean()
-            
-            # Create pivot matrix
-            pivot = combined.pivot(index="user", columns="item", values="rating").fillna(0)
-            user_ids = pivot.index.to_numpy()
-            
-            # SVD decomposition
-            svd = TruncatedSVD(n_components=50, random_state=42)
-            user_factors = svd.fit_transform(csr_matrix(pivot.values))
-
-            # Load and align user metadata
-            user_meta = pd.read_csv(
-                os.path.join(DATA_DIR, "u.user"),
-                sep="|",
-                names=["user_id", "age", "gender", "occupation", "zip_code"]
-            ).set_index("user_id")
-            
-            # Add missing users and reindex
-            missing_users = set(user_ids) - set(user_meta.index)
-            default_age = user_meta["age"].mean()
-            default_gender = user_meta["gender"].mode()[0]
-            default_occupation = user_meta["occupation"].mode()[0]
-            
-            for uid in missing_users:
-                user_meta.loc[uid] = [default_age, default_gender, default_occupation, "00000"]
-            
-            # Ensure metadata alignment with pivot users
-            user_meta = user_meta.reindex(user_ids)
+        
+        data_manager.load_users()
+        # pick up users other workers appended to u.user
+        data_manager.users.refresh()
+        return fit_models(combined, data_manager.users.frame())
 
-            # Feature engineering
-            scaler_age = StandardScaler()  # Assign the scaler to a variable
-            age_scaled = scaler_age.fit_transform(user_meta[["age"]])
+    def _complete(self, models: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill in what a bundle may lack: neighbour table and id indexes."""
+        if "all_neighbors" not in models:
+            with TRAIN_PHASE_SECONDS.time(phase="neighbor_table"):
+                distances, indices = neighbor_table(models["nn_model"], models["user_profiles"])
+            models["all_neighbors"] = {"indices": indices, "distances": distances}
+        data_manager.index_models(models)
+        models.setdefault("fit_users", len(models["user_ids"]))
+        models.setdefault("fit_time", time.time())
+        models.setdefault("folded_ids", np.array([], dtype=np.int64))
+        return models
 
-            ohe_gender = OneHotEncoder(sparse_output=False, handle_unknown="ignore")
-            gender_feats = ohe_gender.fit_transform(user_meta[["gender"]])
+    def _save(self, models: Dict[str, Any]):
+        """Write `models` as a new bundle version and point `current` at it."""
+        with TRAIN_PHASE_SECONDS.time(phase="save"), self.bundle_lock:
+            save_bundle(MODEL_DIR, models)
 
-            ohe_occupation = OneHotEncoder(sparse_output=False, handle_unknown="ignore")
-            occ_feats = ohe_occupation.fit_transform(user_meta[["occupation"]])
-            
-            # Ensure dimensional alignment
-            user_profiles = np.hstack([
-                user_factors,
-                age_scaled,
-                gender_feats,
-                occ_feats
-            ])
-
-            # Model training
-            nn = NearestNeighbors(n_neighbors=50, metric="cosine")
-            nn.fit(user_profiles)
-
-            # Save artifacts
-            artifacts = {
-                "user_ids": user_ids,
-                "item_ids": pivot.columns.to_numpy(),
-                "item_factors": svd.components_.T,
-                "user_profiles": user_profiles,
-                "global_mean": combined["rating"].mean(),
-                "nn_model": nn,
-                "svd": svd,  # Add SVD instance
-                "scaler_age": scaler_age,  # Add scaler
-                "ohe_gender": ohe_gender,  # Add encoder
-                "ohe_occupation": ohe_occupation,  # Add encoder
-            }
-            
-            for name, obj in artifacts.items():
-                with open(os.path.join(MODEL_DIR, f"{name}.pkl"), "wb") as f:
-                    pickle.dump(obj, f)
-
-            # Update application state
-            distances, indices = nn.kneighbors(user_profiles)
-            data_manager.app_state["models"].update({
-                "all_neighbors": {"indices": indices, "distances": distances},
-                **artifacts
-            })
+    def _publish(self, models: Dict[str, Any], full: bool = True) -> Dict[str, Any]:
+        with self._status_lock:
+            self.version += 1
+            models["version"] = self.version
+            self.status["version"] = self.version
+            self.status["bundle_version"] = models.get("bundle_version")
+            self.status["folded_users"] = len(models["folded_ids"])
+            self.status["drift"] = len(models["folded_ids"]) / max(models["fit_users"], 1)
+
+        # atomic publish: readers hold either the old or the new dict
+        data_manager.app_state["models"] = models
+        # cold-start entries hold raw user ids and stay usable across
+        # fold-ins; only a new fit (new latent space) invalidates them
+        if full:
+            data_manager.cold_start_cache.clear()
+        return models
+
+    def _ensure_data(self):
+        if data_manager.app_state["data"]["rating_matrices"] is None:
             data_manager.initialize_state()
 
+    def has_saved_model(self) -> bool:
+        return current_bundle(MODEL_DIR) is not None or has_legacy_artifacts(MODEL_DIR)
+
+    def read_models(self) -> Dict[str, Any]:
+        """
+        Map the current bundle from MODEL_DIR, without publishing it.
+        Per-artifact pickles from before bundles existed, and bundles in an
+        older format, are converted once by saving them as a new version.
+        """
+        models = load_bundle(MODEL_DIR)
+        if models is None:
+            logger.info("Converting legacy model pickles to a bundle")
+            models = self._complete(load_legacy_artifacts(MODEL_DIR))
+            self._save(models)
+        elif models["bundle_format"] < BUNDLE_FORMAT:
+            logger.info("Upgrading model bundle", extra={"format": models["bundle_format"]})
+            self._save(self._complete(models))
+        else:
+            self._complete(models)
+        return models
+
+    def publish_loaded(self, models: Dict[str, Any]) -> Dict[str, Any]:
+        """Attach the top-N cache to read_models() output and publish it (needs the rating state)."""
+        data_manager.load_top_n_cache(models)
+        return self._publish(models)
+
+    def load_models(self) -> Dict[str, Any]:
+        """Map the current bundle from MODEL_DIR and publish it."""
+        self._ensure_data()
+        return self.publish_loaded(self.read_models())
+
+    def ensure_bundle(self) -> str:
+        """
+        Make sure MODEL_DIR holds a bundle the service can map straight
+        away (run by the k8s init container): a valid current bundle is
+        kept, legacy pickles and older formats are converted, and only
+        without any saved model is one trained. Returns what was done.
+        """
+        if is_valid_bundle(MODEL_DIR):
+            return "kept"
+        if self.has_saved_model():
+            try:
+                self.load_models()
+            except Exception as e:
+                logger.warning("Saved model unusable, retraining", extra={"error": str(e)})
+            if is_valid_bundle(MODEL_DIR):
+                return "converted"
+        self.train_model()
+        return "trained"
+
+    def train_model(self) -> Dict[str, Any]:
+        """Train, save and publish a new bundle synchronously."""
+        self._ensure_data()
+        with TRAIN_SECONDS.time(kind="full"):
+            models = self._complete(self._fit())
+            self._save(models)
+            # Precompute top-N for every trained user off the rating state on
+            # disk, which includes feedback logged by other workers
+            with TRAIN_PHASE_SECONDS.time(phase="top_n"):
+                data_manager.load_rating_state()
+                data_manager.build_top_n_cache(models, save=True)
+            return self._publish(models)
+
+    # ─── Incremental fold-in ─────────────────────────────────────────
+    # Folded-in users are appended after the fitted rows instead of
+    # rebuilding the bundle arrays, which stay as mapped from disk:
+    #
+    #   rows 0 .. n_fit-1     fitted users       user_ids, all_neighbors (bundle)
+    #   rows n_fit ..         folded-in users    M["fold"]: user_ids, indices,
+    #                                            distances (RowBuffer views)
+    #
+    # A user folded in again gets a new row; fold["ids"]/["rows"] point each
+    # folded user at its latest row and nn_model masks the replaced ones.
+    # Everyone else keeps their neighbour rows, and a full refit starts over.
+    def fold_in(self, user_ids: Iterable[int]) -> Dict[str, Any]:
+        """
+        Project users onto the current SVD components from their live ratings
+        and publish a bundle with their profiles added to the neighbour index
+        and their neighbour and top-N rows appended. Costs O(users folded in
+        since the fit), whatever the number of fitted users.
+        """
+        M = data_manager.app_state["models"]
+        matrices = data_manager.app_state["data"]["rating_matrices"]
+        user_ids = np.unique(np.asarray(list(user_ids), dtype=np.int64))
+        if not M or user_ids.size == 0:
+            return M
+
+        # latent part: ratings times V^T, each rating matched to its row of
+        # item_factors through item_index (items the fit never saw drop out)
+        X = matrices.user_rows(user_ids).tocoo()
+        factor_rows = lookup_rows(M["item_index"], X.col)
+        known = factor_rows >= 0
+        X = csr_matrix((X.data[known], (X.row[known], factor_rows[known])),
+                       shape=(len(user_ids), len(M["item_ids"])))
+        latent = np.asarray(X @ M["item_factors"])
+
+        # side-info part; users without metadata get the all-default encoding
+        n_latent = M["item_factors"].shape[1]
+        side = np.zeros((len(user_ids), M["user_profiles"].shape[1] - n_latent))
+        # users created on another worker since u.user was last read are picked up
+        meta = data_manager.user_rows(user_ids)
+        has_meta = np.isin(user_ids, meta.index)
+        if has_meta.any():
+            side[has_meta] = side_features(M, meta.loc[user_ids[has_meta]])
+        profiles = np.hstack([latent, side])
+
+        table = M["all_neighbors"]
+        fold = M.get("fold") or {
+            "user_ids": np.zeros(0, dtype=np.int64),
+            "indices": np.zeros((0, table["indices"].shape[1]), dtype=table["indices"].dtype),
+            "distances": np.zeros((0, table["distances"].shape[1])),
+            "buffers": {},
+            "ids": np.zeros(0, dtype=np.int64),
+            "rows": np.zeros(0, dtype=np.int64),
+            "top_n": {},
+        }
+        previous = lookup_user_rows(M, user_ids)
+        first = len(M["user_ids"]) + len(fold["user_ids"])
+        rows = np.arange(first, first + len(user_ids))
+        nn = M["nn_model"].add(profiles, replace=previous[previous >= 0])
+        distances, indices = nn.kneighbors(profiles, n_neighbors=table["indices"].shape[1])
+
+        new_fold = {"buffers": dict(fold["buffers"])}
+        for name, values in (("user_ids", user_ids), ("indices", indices), ("distances", distances)):
+            buffer = fold["buffers"].get(name) or RowBuffer(fold[name])
+            new_fold["buffers"][name], new_fold[name] = buffer.extend(fold[name], values)
+        # latest row per folded user: unique keeps the first of the reversed list
+        ids = np.concatenate([fold["ids"], user_ids])[::-1]
+        new_fold["ids"], latest = np.unique(ids, return_index=True)
+        new_fold["rows"] = np.concatenate([fold["rows"], rows])[::-1][latest]
+
+        models = {**M, "nn_model": nn, "fold": new_fold, "folded_ids": new_fold["ids"]}
+
+        # only the folded users' cached top-N lists change
+        neighbors, weights = table_neighbors(models, rows)
+        new_fold["top_n"] = dict(fold["top_n"])
+        for uid, items in zip(user_ids, top_n_batch(matrices, neighbors, weights, models["global_mean"],
+                                                    user_ids, n=TOP_N_CACHE_DEPTH)):
+            new_fold["top_n"][int(uid)] = np.asarray(items)
+        top_n = M.get("top_n") or {}
+        models["top_n"] = ChainMap(new_fold["top_n"], top_n.maps[-1] if isinstance(top_n, ChainMap) else top_n)
+        return self._publish(models, full=False)
+
+    def request_fold_in(self, user_ids: Iterable[int]):
+        """Queue users for fold-in; queued users are folded in one batch."""
+        with self._status_lock:
+            self._fold_users.update(int(u) for u in user_ids)
+            if self._fold_scheduled:
+                return
+            self._fold_scheduled = True
+        self._executor.submit(self._fold_in_loop)
+
+    def _fold_in_loop(self):
+        while True:
+            # at most one fold-in per FOLD_IN_INTERVAL: feedback arriving
+            # meanwhile piles up into the next batch
+            wait = self._last_fold_in + FOLD_IN_INTERVAL - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            with self._status_lock:
+                users = sorted(self._fold_users)
+                self._fold_users.clear()
+                if not users:
+                    self._fold_scheduled = False
+                    return
+            self._last_fold_in = time.monotonic()
+            try:
+                with TRAIN_SECONDS.time(kind="fold_in"):
+                    self.fold_in(users)
+                with self._status_lock:
+                    self.status["fold_ins"] += 1
+            except Exception as e:
+                logger.error("Fold-in failed", extra={"error": str(e)})
+                continue
+            self.maybe_full_retrain()
+
+    def fold_in_missing(self) -> int:
+        """
+        Queue the users the published bundle is behind on: anyone with
+        feedback written since it was fitted (still in the log, or merged
+        into u1.base, where merged rows carry the merge time), and anyone
+        with ratings but no fitted row. Folded-in rows are not saved with
+        the bundle, so this is how a restarted worker gets them back.
+        Returns the number queued.
+        """
+        M = data_manager.app_state["models"]
+        matrices = data_manager.app_state["data"]["rating_matrices"]
+        if not M or matrices is None:
+            return 0
+        rated = np.flatnonzero(np.diff(matrices.rating.indptr))
+        users = set(rated[lookup_rows(M["user_index"], rated) < 0].tolist())
+        with data_manager.feedback_lock:
+            base_df = pd.read_csv(
+                os.path.join(DATA_DIR, "u1.base"),
+                sep="\t",
+                names=["user", "item", "rating", "timestamp"],
+                usecols=["user", "timestamp"]
+            )
+        users.update(int(u) for u in base_df.loc[base_df["timestamp"] > M["fit_time"], "user"].unique())
+        log = data_manager.feedback_log.path
+        if os.path.exists(log) and os.path.getmtime(log) > M["fit_time"]:
+            with data_manager.feedback_lock:
+                feedback = data_manager.feedback_log.read()
+            users.update(int(u) for u in feedback["user"].unique())
+        if users:
+            logger.info("Folding in users missing from the bundle", extra={"users": len(users)})
+            self.request_fold_in(users)
+        return len(users)
+
+    def maybe_full_retrain(self) -> bool:
+        """Schedule a full refit when fold-in drift or the refit interval is exceeded."""
+        M = data_manager.app_state["models"]
+        if not M:
+            return False
+        # distinct users folded in since the last full fit
+        drift = len(M["folded_ids"]) / max(M["fit_users"], 1)
+        stale = FULL_RETRAIN_INTERVAL > 0 and time.time() - M["fit_time"] > FULL_RETRAIN_INTERVAL
+        if drift <= FOLD_IN_DRIFT_THRESHOLD and not stale:
+            return False
+        with self._status_lock:
+            if self._running:
+                return False
+        logger.info("Scheduling full retrain", extra={"drift": drift, "stale": stale})
+        self.request_retrain()
+        return True
+
+    # ─── Background retraining ───────────────────────────────────────
+    def request_retrain(self) -> Dict[str, Any]:
+        """
+        Schedule a background retrain. If one is already running the
+        request is coalesced into a single follow-up run.
+        """
+        with self._status_lock:
+            if self._running:
+                if self._pending:
+                    self.status["coalesced"] += 1
+                self._pending = True
+                return {**self.status, "scheduled": "queued"}
+            self._running = True
+            self.status["state"] = "running"
+        self._executor.submit(self._retrain_loop)
+        return {**self.status, "scheduled": "started"}
+
+    def _retrain_loop(self):
+        while True:
+            started = time.time()
+            with self._status_lock:
+                self.status["last_started"] = started
+            error = None
+            try:
+                logger.info("Background retraining started")
+                self.train_model()
+                logger.info("Background retraining completed")
+            except Exception as e:
+                error = str(e)
+                logger.error("Background retraining failed", extra={"error": error})
+
+            with self._status_lock:
+                self.status.update({
+                    "last_finished": time.time(),
+                    "last_duration": time.time() - started,
+                    "last_error": error,
+                    "runs": self.status["runs"] + 1,
+                })
+                if self._pending:
+                    self._pending = False
+                    continue
+                self._running = False
+                self.status["state"] = "idle"
+                return
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._status_lock:
+            return {**self.status, "pending": self._pending}
+
 model_manager = ModelManager()
\ No newline at end of file
@@ -0,0 +1,436 @@
+import copy
+import inspect
+import math
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+# Backend for the user-profile neighbour model: exact | lsh | ivf
+NEIGHBOR_INDEX = os.getenv("NEIGHBOR_INDEX", "exact")
+def _cgroup_cpu_quota() -> Optional[float]:
+    # cgroup v2 "cpu.max" holds "<quota> <period>"; v1 keeps them in two files
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                quota = f.read().strip()
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = f.read().strip()
+        except OSError:
+            return None
+    if quota in ("max", "-1"):
+        return None
+    return int(quota) / int(period)
+
+def _available_cpus() -> int:
+    """CPUs this process may use: its affinity mask, capped by the cgroup CPU quota (k8s limit)."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+# Exact neighbour search: memory for the similarity blocks of all workers
+# together (MB), which sets the query rows per X @ X.T block, and worker threads
+NEIGHBOR_MEMORY_MB = float(os.getenv("NEIGHBOR_MEMORY_MB", "256"))
+NEIGHBOR_WORKERS = int(os.getenv("NEIGHBOR_WORKERS", str(_available_cpus())))
+
+def _block_rows(n: int, workers: int = 1) -> int:
+    # per query row: a float64 similarity and argpartition's int64 index per column
+    return max(1, int(NEIGHBOR_MEMORY_MB * 2 ** 20 // (workers * max(n, 1) * 16)))
+
+def _normalized(X: np.ndarray, dtype=np.float32) -> np.ndarray:
+    X = np.asarray(X, dtype=dtype)
+    return X / np.maximum(np.linalg.norm(X, axis=1, keepdims=True), 1e-12)
+
+def _top_k(sims: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """k best (cosine distance, id) pairs from one row of similarities, nearest first."""
+    if sims.size > k:
+        part = np.argpartition(-sims, k - 1)[:k]
+        sims, ids = sims[part], ids[part]
+    order = np.lexsort((ids, -sims))
+    return 1.0 - sims[order].astype(np.float64), ids[order]
+
+def _block_top_k(sims: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """k best (cosine distance, column) pairs per row of a similarity block, nearest first."""
+    # negated in place so the block is the only (rows, n) float buffer
+    neg_sims = np.negative(sims, out=sims)
+    part = np.argpartition(neg_sims, k - 1, axis=1)[:, :k].copy()
+    part_sims = -np.take_along_axis(neg_sims, part, 1)
+    # nearest first, ties by lower index
+    order = np.lexsort((part, -part_sims), axis=1)
+    return np.clip(1.0 - np.take_along_axis(part_sims, order, 1), 0.0, 2.0), np.take_along_axis(part, order, 1)
+
+class _Params:
+    """
+    get_params/set_params over the __init__ arguments: the part of the
+    scikit-learn estimator API the indexes need (sklearn.clone works on
+    them), without importing scikit-learn on the serving path.
+    """
+
+    def get_params(self, deep: bool = True) -> Dict[str, Any]:
+        names = list(inspect.signature(type(self).__init__).parameters)[1:]
+        return {name: getattr(self, name) for name in names}
+
+    def set_params(self, **params) -> "_Params":
+        for name, value in params.items():
+            setattr(self, name, value)
+        return self
+
+    def __repr__(self) -> str:
+        args = ", ".join(f"{k}={v!r}" for k, v in self.get_params().items())
+        return f"{type(self).__name__}({args})"
+
+class RowBuffer:
+    """
+    Append-only rows with spare capacity, for arrays that grow between
+    refits. extend() writes past every row handed out so far and returns a
+    view of all rows; when capacity runs out the rows move to a buffer
+    twice the size. Either way a view handed out earlier never changes, so
+    it can sit in a published snapshot while later rows are appended.
+    """
+
+    def __init__(self, rows: np.ndarray):
+        rows = np.asarray(rows)
+        self._data = np.empty((max(2 * len(rows), 64),) + rows.shape[1:], dtype=rows.dtype)
+        self._data[:len(rows)] = rows
+        self.size = len(rows)
+
+    def extend(self, view: np.ndarray, rows: np.ndarray) -> Tuple["RowBuffer", np.ndarray]:
+        """`view` (this buffer's latest view) followed by `rows`: (buffer, new view)."""
+        if len(view) != self.size:
+            # an older view: branch off rather than overwrite rows appended after it
+            return RowBuffer(view).extend(view, rows)
+        end = self.size + len(rows)
+        if end > len(self._data):
+            grown = np.empty((2 * end,) + self._data.shape[1:], dtype=self._data.dtype)
+            grown[:self.size] = self._data[:self.size]
+            self._data = grown
+        self._data[self.size:end] = rows
+        self.size = end
+        return self, self._data[:end]
+
+class _Appendable:
+    """
+    Rows added after fit (folded-in users). add() returns a new version of
+    the index that shares the fitted structure: the added rows go to a
+    RowBuffer, numbered after the fitted ones, and the rows they replace
+    are masked out. Added rows are compared exactly on every query; there
+    are few of them, since a refit starts without any.
+    """
+
+    # (buffer, view) of the added rows, L2-normalized; sorted masked-out rows
+    added_: Optional[Tuple[RowBuffer, np.ndarray]] = None
+    removed_ = np.zeros(0, dtype=np.int64)
+
+    def add(self, X: np.ndarray, replace: Optional[np.ndarray] = None) -> "_Appendable":
+        rows = _normalized(X, np.float64)
+        buffer, view = self.added_ or (RowBuffer(rows[:0]), rows[:0])
+        index = copy.copy(self)
+        index.added_ = buffer.extend(view, rows)
+        if replace is not None:
+            index.removed_ = np.union1d(self.removed_, replace).astype(np.int64)
+        return index
+
+    def kneighbors(self, X: np.ndarray, n_neighbors: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        k = n_neighbors or self.n_neighbors
+        n_fit = len(self.data_)
+        if self.added_ is None and not self.removed_.size:
+            return self._search(X, min(k, n_fit))
+
+        removed = self.removed_[self.removed_ < n_fit]
+        results = []
+        if n_fit > removed.size:
+            results.append(self._search(X, min(k, n_fit - removed.size), removed if removed.size else None))
+        added = self.added_[1] if self.added_ else np.zeros((0, 0))
+        added_removed = self.removed_[self.removed_ >= n_fit] - n_fit
+        if len(added) > added_removed.size:
+            sims = _normalized(X, np.float64) @ added.T
+            sims[:, added_removed] = -np.inf
+            distances, indices = _block_top_k(sims, min(k, len(added) - added_removed.size))
+            results.append((distances, indices + n_fit))
+
+        distances = np.hstack([d for d, _ in results])
+        indices = np.hstack([i for _, i in results])
+        order = np.lexsort((indices, distances), axis=1)[:, :k]
+        return np.take_along_axis(distances, order, 1), np.take_along_axis(indices, order, 1)
+
+class ExactIndex(_Appendable, _Params):
+    """
+    Brute-force cosine neighbours (the results of NearestNeighbors with
+    metric="cosine"). fit() keeps a reference to the profiles plus their
+    norms, so a memory-mapped bundle array is shared rather than copied;
+    queries are scored in blocks sized to NEIGHBOR_MEMORY_MB.
+    """
+
+    def __init__(self, n_neighbors: int = 50):
+        self.n_neighbors = n_neighbors
+
+    def fit(self, X: np.ndarray) -> "ExactIndex":
+        self.data_ = np.asarray(X)
+        self.norms_ = np.maximum(np.linalg.norm(self.data_, axis=1), 1e-12)
+        return self
+
+    def _search(self, X: np.ndarray, k: int,
+                removed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        Q = _normalized(X, np.float64)
+        distances = np.empty((len(Q), k))
+        indices = np.empty((len(Q), k), dtype=np.int64)
+        block = _block_rows(len(self.data_))
+        for start in range(0, len(Q), block):
+            sims = Q[start:start + block] @ self.data_.T
+            sims /= self.norms_
+            if removed is not None:
+                sims[:, removed] = -np.inf
+            distances[start:start + block], indices[start:start + block] = _block_top_k(sims, k)
+        return distances, indices
+
+class LSHIndex(_Appendable, _Params):
+    """
+    Random-hyperplane LSH for cosine similarity. Each of `n_tables` tables
+    hashes a profile to the sign pattern of `n_bits` random projections;
+    a query's candidates are every profile sharing its bucket in any table
+    (plus the buckets one bit flip away when `multiprobe` is set), re-ranked
+    by exact cosine. Queries with fewer than k candidates fall back to a
+    full scan, so results are always k long.
+    """
+
+    def __init__(self, n_neighbors: int = 50, n_tables: int = 16, n_bits: Optional[int] = None,
+                 multiprobe: bool = True, random_state: int = 42):
+        self.n_neighbors = n_neighbors
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.multiprobe = multiprobe
+        self.random_state = random_state
+
+    def _hash(self, X: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        # (n, tables) integer bucket codes
+        weights = 1 << np.arange(self.planes_.shape[2], dtype=np.int64)
+        return np.concatenate([
+            (np.einsum("nd,tdb->ntb", X[s:s + chunk], self.planes_) > 0).astype(np.int64) @ weights
+            for s in range(0, len(X), chunk)
+        ]) if len(X) else np.zeros((0, self.n_tables), dtype=np.int64)
+
+    def fit(self, X: np.ndarray) -> "LSHIndex":
+        self.data_ = _normalized(X)
+        n, d = self.data_.shape
+        # aim for buckets of ~n_neighbors / 2 profiles
+        bits = self.n_bits or int(np.clip(round(np.log2(max(n / self.n_neighbors, 1))) + 1, 1, 24))
+        rng = np.random.default_rng(self.random_state)
+        self.planes_ = rng.standard_normal((self.n_tables, d, bits)).astype(np.float32)
+        # per table: profile ids sorted by bucket code, shape (tables, n)
+        codes = self._hash(self.data_).T
+        self.order_ = np.argsort(codes, axis=1, kind="stable")
+        self.codes_ = np.take_along_axis(codes, self.order_, axis=1)
+        flips = [0] + ([1 << b for b in range(bits)] if self.multiprobe else [])
+        self.flips_ = np.array(flips, dtype=np.int64)
+        return self
+
+    def _candidates(self, codes: np.ndarray) -> np.ndarray:
+        # every (table, probe) bucket is a [lo, hi) run of the sorted codes
+        probes = codes[:, None] ^ self.flips_[None, :]
+        lo = np.empty(probes.shape, dtype=np.int64)
+        hi = np.empty(probes.shape, dtype=np.int64)
+        for t in range(self.n_tables):
+            lo[t] = np.searchsorted(self.codes_[t], probes[t], side="left")
+            hi[t] = np.searchsorted(self.codes_[t], probes[t], side="right")
+        lengths = (hi - lo).ravel()
+        if not lengths.any():
+            return np.array([], dtype=np.int64)
+        # flatten the runs into positions of the raveled order_
+        starts = (lo + np.arange(self.n_tables)[:, None] * self.order_.shape[1]).ravel()
+        pos = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return np.unique(self.order_.ravel()[pos])
+
+    def _search(self, X: np.ndarray, k: int,
+                removed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        Q = _normalized(X)
+        codes = self._hash(Q)
+        distances = np.empty((len(Q), k))
+        indices = np.empty((len(Q), k), dtype=np.int64)
+        everyone = np.arange(len(self.data_))
+        if removed is not None:
+            everyone = np.setdiff1d(everyone, removed, assume_unique=True)
+        for row, (q, code) in enumerate(zip(Q, codes)):
+            cand = self._candidates(code)
+            if removed is not None:
+                cand = cand[~np.isin(cand, removed, assume_unique=True)]
+            if cand.size < k:
+                cand = everyone
+            distances[row], indices[row] = _top_k(self.data_[cand] @ q, cand, k)
+        return distances, indices
+
+class IVFIndex(_Appendable, _Params):
+    """
+    Inverted-file index over L2-normalized profiles: spherical k-means splits
+    the profiles into `n_lists` clusters and a query is compared exactly
+    against the members of its `n_probe` closest clusters. Queries are
+    processed cluster by cluster, so every step is one matrix product.
+    """
+
+    def __init__(self, n_neighbors: int = 50, n_lists: Optional[int] = None, n_probe: int = 8,
+                 n_iter: int = 10, random_state: int = 42):
+        self.n_neighbors = n_neighbors
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.random_state = random_state
+
+    def _assign(self, X: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        return np.concatenate([
+            np.argmax(X[s:s + chunk] @ self.centroids_.T, axis=1)
+            for s in range(0, len(X), chunk)
+        ]) if len(X) else np.array([], dtype=np.int64)
+
+    def fit(self, X: np.ndarray) -> "IVFIndex":
+        data = _normalized(X)
+        n = len(data)
+        lists = self.n_lists or max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(self.random_state)
+        # k-means on a bounded sample; the assignment below covers everyone
+        sample = data[rng.choice(n, min(n, 256 * lists), replace=False)]
+        self.centroids_ = sample[rng.choice(len(sample), min(lists, len(sample)), replace=False)]
+        for _ in range(self.n_iter):
+            labels = self._assign(sample)
+            sums = np.zeros_like(self.centroids_)
+            np.add.at(sums, labels, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = self.centroids_[empty]
+            self.centroids_ = _normalized(sums)
+
+        labels = self._assign(data)
+        self.order_ = np.argsort(labels, kind="stable")
+        self.data_ = data[self.order_]
+        self.offsets_ = np.searchsorted(labels[self.order_], np.arange(len(self.centroids_) + 1))
+        return self
+
+    def _search(self, X: np.ndarray, k: int, removed: Optional[np.ndarray] = None,
+                chunk: int = 8192) -> Tuple[np.ndarray, np.ndarray]:
+        Q = _normalized(X)
+        # masked-out rows as positions in the cluster-sorted data_
+        removed_pos = np.zeros(0, dtype=np.int64)
+        if removed is not None:
+            if getattr(self, "position_", None) is None:
+                self.position_ = np.empty_like(self.order_)
+                self.position_[self.order_] = np.arange(len(self.order_))
+            removed_pos = np.sort(self.position_[removed])
+        # blocks of queries keep the (queries, lists) probe scores bounded
+        results = [self._search_block(Q[s:s + chunk], k, removed_pos) for s in range(0, len(Q), chunk)]
+        if not results:
+            return np.empty((0, k)), np.empty((0, k), dtype=np.int64)
+        return np.vstack([d for d, _ in results]), np.vstack([i for _, i in results])
+
+    def _search_block(self, Q: np.ndarray, k: int, removed_pos: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        probe = min(self.n_probe, len(self.centroids_))
+        probes = np.argpartition(-(Q @ self.centroids_.T), probe - 1, axis=1)[:, :probe].copy()
+
+        best_sims = np.full((len(Q), k), -np.inf, dtype=np.float32)
+        best_pos = np.full((len(Q), k), -1, dtype=np.int64)
+        # group (query, cluster) probe pairs by cluster
+        pair_c = probes.ravel()
+        pair_q = np.repeat(np.arange(len(Q)), probe)[np.argsort(pair_c, kind="stable")]
+        bounds = np.searchsorted(np.sort(pair_c), np.arange(len(self.centroids_) + 1))
+        for c in np.flatnonzero(np.diff(bounds)):
+            rows = pair_q[bounds[c]:bounds[c + 1]]
+            lo, hi = self.offsets_[c], self.offsets_[c + 1]
+            if hi == lo:
+                continue
+            cluster_sims = Q[rows] @ self.data_[lo:hi].T
+            masked = removed_pos[np.searchsorted(removed_pos, lo):np.searchsorted(removed_pos, hi)]
+            cluster_sims[:, masked - lo] = -np.inf
+            sims = np.hstack([best_sims[rows], cluster_sims])
+            pos = np.hstack([best_pos[rows], np.broadcast_to(np.arange(lo, hi), (len(rows), hi - lo))])
+            if sims.shape[1] > k:
+                keep = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+                sims, pos = np.take_along_axis(sims, keep, 1), np.take_along_axis(pos, keep, 1)
+            best_sims[rows], best_pos[rows] = sims, pos
+
+        # too few candidates in the probed lists: scan everything for those rows
+        short = np.flatnonzero(np.isneginf(best_sims).any(axis=1))
+        if short.size:
+            sims = Q[short] @ self.data_.T
+            sims[:, removed_pos] = -np.inf
+            keep = np.argpartition(-sims, k - 1, axis=1)[:, :k].copy()
+            best_sims[short] = np.take_along_axis(sims, keep, 1)
+            best_pos[short] = keep
+
+        order = np.argsort(-best_sims, axis=1, kind="stable")
+        distances = 1.0 - np.take_along_axis(best_sims, order, 1).astype(np.float64)
+        indices = self.order_[np.take_along_axis(best_pos, order, 1)]
+        return distances, indices
+
+def build_neighbor_index(kind: Optional[str] = None, n_neighbors: int = 50):
+    """Unfitted neighbour model for `kind` (default: NEIGHBOR_INDEX)."""
+    kind = kind or NEIGHBOR_INDEX
+    if kind == "exact":
+        return ExactIndex(n_neighbors=n_neighbors)
+    if kind == "lsh":
+        return LSHIndex(n_neighbors=n_neighbors)
+    if kind == "ivf":
+        return IVFIndex(n_neighbors=n_neighbors)
+    raise ValueError(f"Unknown NEIGHBOR_INDEX {kind!r} (expected exact, lsh or ivf)")
+
+def is_exact(nn) -> bool:
+    """ExactIndex, or a cosine NearestNeighbors from a bundle that predates it."""
+    return isinstance(nn, ExactIndex) or getattr(nn, "metric", None) == "cosine"
+
+def unfitted(nn):
+    """Fresh copy of a neighbour model with the same parameters (an ExactIndex for exact ones)."""
+    if is_exact(nn):
+        return ExactIndex(n_neighbors=nn.n_neighbors)
+    return type(nn)(**nn.get_params())
+
+# ─── Exact neighbour tables ──────────────────────────────────────
+def blocked_kneighbors(profiles: np.ndarray, k: int, rows: Optional[np.ndarray] = None,
+                       block_size: Optional[int] = None,
+                       workers: int = NEIGHBOR_WORKERS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact cosine kneighbors of profiles[rows] against all profiles, computed
+    as blocks of X[rows] @ X.T on L2-normalized rows with argpartition.
+    Instead of the full pairwise matrix, each worker holds one (block_size, n)
+    similarity block; by default block_size is chosen so all workers' blocks
+    fit in NEIGHBOR_MEMORY_MB. Blocks run on a thread pool (BLAS drops the
+    GIL and is pinned to one thread per worker so the pool does the scaling).
+    """
+    data = np.asarray(profiles, dtype=np.float64)
+    data = data / np.maximum(np.linalg.norm(data, axis=1, keepdims=True), 1e-12)
+    rows = np.arange(len(data)) if rows is None else np.asarray(rows)
+    k = min(k, len(data))
+    block_size = block_size or _block_rows(len(data), workers)
+    distances = np.empty((len(rows), k))
+    indices = np.empty((len(rows), k), dtype=np.int64)
+
+    def run_block(start: int):
+        sims = data[rows[start:start + block_size]] @ data.T
+        distances[start:start + block_size], indices[start:start + block_size] = _block_top_k(sims, k)
+
+    # only needed while building tables, not on the serving path
+    from threadpoolctl import threadpool_limits
+
+    starts = range(0, len(rows), block_size)
+    with threadpool_limits(limits=1 if workers > 1 else None, user_api="blas"):
+        if workers > 1 and len(starts) > 1:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="neighbors") as pool:
+                list(pool.map(run_block, starts))
+        else:
+            for start in starts:
+                run_block(start)
+    return distances, indices
+
+def neighbor_table(nn, profiles: np.ndarray, rows: Optional[np.ndarray] = None,
+                   n_neighbors: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    kneighbors for profiles[rows] (default: every profile). Exact models use
+    the blocked scan; approximate indexes answer from their own structure.
+    """
+    k = n_neighbors or nn.n_neighbors
+    if is_exact(nn):
+        return blocked_kneighbors(profiles, k, rows)
+    queries = profiles if rows is None else profiles[rows]
+    return nn.kneighbors(queries, n_neighbors=k)
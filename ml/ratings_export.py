@@ -0,0 +1,143 @@
+import io
+import os
+from itertools import islice
+from typing import Iterator, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+from feedback_log import FEEDBACK_HEADER, FeedbackLog
+
+RATING_COLUMNS = ["user_id", "item_id", "rating", "timestamp"]
+# Rows per page when the caller does not ask for a size, and the hard cap
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "50000"))
+EXPORT_MAX_PAGE_SIZE = int(os.getenv("EXPORT_MAX_PAGE_SIZE", "500000"))
+
+# The export walks two segments in order: u1.base ("b"), then the buffered
+# feedback log ("f"). A cursor is "<segment>.<inode>.<position>", the byte
+# offset of the next line in that file. u1.base is only replaced wholesale
+# (merge) and the log only appended to or deleted, so an inode change means
+# the offset no longer points at the same rows and the client has to start
+# over. The log is exported raw: a re-rated item appears once per rating,
+# in write order, and the client keeps the last one (last write wins).
+# Only one page is ever held in memory.
+
+class CursorExpired(ValueError):
+    """The file a cursor points into was replaced since the cursor was issued."""
+
+def _empty_page() -> pd.DataFrame:
+    return pd.DataFrame({
+        "user_id": pd.Series(dtype="int32"),
+        "item_id": pd.Series(dtype="int32"),
+        "rating": pd.Series(dtype="float64"),
+        "timestamp": pd.Series(dtype="int64"),
+    })
+
+def _inode(path: str) -> int:
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return 0
+
+def encode_cursor(segment: str, inode: int, position: int) -> str:
+    return f"{segment}.{inode}.{position}"
+
+def decode_cursor(cursor: Optional[str]) -> Tuple[str, int, int]:
+    if not cursor:
+        return "b", 0, 0
+    try:
+        segment, inode, position = cursor.split(".")
+        if segment not in ("b", "f"):
+            raise ValueError
+        return segment, int(inode), int(position)
+    except ValueError:
+        raise ValueError(f"Malformed cursor {cursor!r}")
+
+# ─── Pages ────────────────────────────────────────────────────────
+def _read_lines(path: str, offset: int, limit: int) -> Tuple[bytes, int, bool]:
+    """
+    Up to `limit` complete lines of `path` from byte `offset`; returns
+    (lines, next offset, done). A torn last line is left for a later page.
+    """
+    if not os.path.exists(path):
+        return b"", offset, True
+    with open(path, "rb") as f:
+        f.seek(offset)
+        lines = list(islice(f, limit))
+    if lines and not lines[-1].endswith(b"\n"):
+        lines.pop()
+        return b"".join(lines), offset + sum(map(len, lines)), False
+    return b"".join(lines), offset + sum(map(len, lines)), len(lines) < limit
+
+def _base_page(path: str, offset: int, limit: int) -> Tuple[pd.DataFrame, int, bool]:
+    """Up to `limit` lines of u1.base from byte `offset`; returns (rows, next offset, done)."""
+    raw, offset, done = _read_lines(path, offset, limit)
+    if not raw:
+        return _empty_page(), offset, done
+    page = pd.read_csv(
+        io.BytesIO(raw),
+        sep="\t",
+        names=RATING_COLUMNS,
+        dtype={"user_id": "int32", "item_id": "int32", "rating": "float64", "timestamp": "int64"},
+    )
+    return page, offset, done
+
+def _feedback_page(log: FeedbackLog, offset: int, limit: int) -> Tuple[pd.DataFrame, int, bool]:
+    """Up to `limit` raw lines of the feedback log from byte `offset` (header skipped)."""
+    if offset == 0 and os.path.exists(log.path):
+        with open(log.path, "rb") as f:
+            header = f.readline()
+        if header == FEEDBACK_HEADER.encode():
+            offset = len(header)
+    raw, offset, done = _read_lines(log.path, offset, limit)
+    if not raw:
+        return _empty_page(), offset, done
+    fb = pd.read_csv(io.BytesIO(raw), names=["user", "item", "rating"], on_bad_lines="skip",
+                     dtype={"user": "int64", "item": "int64", "rating": "float64"})
+    # the log holds at most one retrain threshold worth of ratings; the
+    # lines carry no time, so they are stamped with the last append
+    try:
+        stamp = int(os.path.getmtime(log.path))
+    except FileNotFoundError:
+        stamp = 0
+    page = pd.DataFrame({
+        "user_id": fb["user"].to_numpy(dtype=np.int32),
+        "item_id": fb["item"].to_numpy(dtype=np.int32),
+        "rating": fb["rating"].to_numpy(dtype=np.float64),
+        "timestamp": np.full(len(fb), stamp, dtype=np.int64),
+    })
+    return page, offset, done
+
+def read_ratings_page(base_path: str, log: FeedbackLog, cursor: Optional[str] = None,
+                      limit: int = EXPORT_PAGE_SIZE,
+                      since: Optional[int] = None) -> Tuple[pd.DataFrame, Optional[str]]:
+    """
+    One page of the rating export starting at `cursor` (None = from the top)
+    and the cursor of the next page (None once both segments are exhausted).
+    `since` keeps rows with timestamp >= since; pages are cut by source rows,
+    so a filtered page can be short or empty without being the last one.
+    """
+    limit = max(1, min(int(limit), EXPORT_MAX_PAGE_SIZE))
+    segment, inode, position = decode_cursor(cursor)
+
+    if segment == "b":
+        base_inode = _inode(base_path)
+        if cursor and inode != base_inode:
+            raise CursorExpired("u1.base was rewritten since this cursor was issued")
+        page, offset, done = _base_page(base_path, position, limit)
+        next_cursor = (encode_cursor("f", _inode(log.path), 0) if done
+                       else encode_cursor("b", base_inode, offset))
+    else:
+        if inode != _inode(log.path):
+            raise CursorExpired("feedback log was merged since this cursor was issued")
+        page, offset, done = _feedback_page(log, position, limit)
+        next_cursor = None if done else encode_cursor("f", inode, offset)
+
+    if since is not None:
+        page = page[page["timestamp"].to_numpy() >= since]
+    return page, next_cursor
+
+def ndjson_lines(page: pd.DataFrame, chunk: int = 10000) -> Iterator[bytes]:
+    """Serialize a page as newline-delimited JSON, `chunk` rows at a time."""
+    for start in range(0, len(page), chunk):
+        text = page.iloc[start:start + chunk].to_json(orient="records", lines=True)
+        yield (text if text.endswith("\n") else text + "\n").encode()
@@ -0,0 +1,287 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, diags
+from typing import Any, Dict, List, Optional, Tuple
+
+# ─── Sparse rating matrices ────────────────────────────────────────
+def _resized(matrix: csr_matrix, shape: Tuple[int, int]) -> csr_matrix:
+    # growing a CSR matrix only needs a longer indptr; data/indices are shared
+    indptr = np.pad(matrix.indptr, (0, shape[0] - matrix.shape[0]), mode="edge")
+    return csr_matrix((matrix.data, matrix.indices, indptr), shape=shape)
+
+class RatingMatrices:
+    """
+    Immutable snapshot of the user×item rating state used for scoring.
+    Rows are raw user ids and columns raw item ids, so no lookup is needed.
+    `rating`/`rated` are the base CSR matrices built at load time; feedback
+    received since then lives in small delta matrices that are added to
+    every product, so a rating is visible without rebuilding the base.
+    Writers build a new snapshot and swap the reference; readers never see
+    a half-applied update.
+    """
+
+    def __init__(self, rating: csr_matrix, rated: csr_matrix,
+                 rating_delta: Optional[csr_matrix] = None,
+                 rated_delta: Optional[csr_matrix] = None):
+        self.rating = rating
+        self.rated = rated
+        self.rating_delta = rating_delta
+        self.rated_delta = rated_delta
+
+    @classmethod
+    def from_ratings(cls, ratings: pd.DataFrame) -> "RatingMatrices":
+        """Build the base matrices from (user, item, rating) rows; duplicates are summed."""
+        users = ratings["user"].to_numpy(dtype=np.int64)
+        items = ratings["item"].to_numpy(dtype=np.int64)
+        values = ratings["rating"].to_numpy(dtype=np.float64)
+
+        shape = (
+            int(users.max()) + 1 if users.size else 1,
+            int(items.max()) + 1 if items.size else 1,
+        )
+        rating = csr_matrix((values, (users, items)), shape=shape)
+        rated = csr_matrix((np.ones_like(values), (users, items)), shape=shape)
+        return cls(rating, rated)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.rating.shape
+
+    def with_feedback(self, pending: Dict[Tuple[int, int], float]) -> "RatingMatrices":
+        """
+        New snapshot with every pending (user, item) -> rating applied as an
+        overwrite on top of the base. `pending` holds all feedback since the
+        base was built, so the deltas are rebuilt from it (it stays small:
+        it is folded into the base on every merge).
+        """
+        if not pending:
+            return RatingMatrices(self.rating, self.rated)
+        keys = np.array(list(pending.keys()), dtype=np.int64)
+        users, items = keys[:, 0], keys[:, 1]
+        values = np.fromiter(pending.values(), dtype=np.float64, count=len(pending))
+
+        shape = (max(self.shape[0], int(users.max()) + 1),
+                 max(self.shape[1], int(items.max()) + 1))
+        rating, rated = self.rating, self.rated
+        if shape != self.shape:
+            rating, rated = _resized(rating, shape), _resized(rated, shape)
+
+        old_rating = np.asarray(rating[users, items]).ravel()
+        old_rated = np.asarray(rated[users, items]).ravel()
+        rating_delta = csr_matrix((values - old_rating, (users, items)), shape=shape)
+        rated_delta = csr_matrix((1 - old_rated, (users, items)), shape=shape)
+        rated_delta.eliminate_zeros()
+        return RatingMatrices(rating, rated, rating_delta, rated_delta)
+
+    def user_rows(self, user_ids: np.ndarray) -> csr_matrix:
+        """Current (base + delta) rating rows for the given user ids."""
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        known = (user_ids >= 0) & (user_ids < self.shape[0])
+        safe = np.where(known, user_ids, 0)
+        rows = self.rating[safe]
+        if self.rating_delta is not None:
+            rows = rows + self.rating_delta[safe]
+        # ids outside the matrix have no ratings yet
+        return (diags(known.astype(np.float64)) @ rows).tocsr()
+
+    def weighted_sums(self, W: csr_matrix) -> Tuple[np.ndarray, np.ndarray]:
+        """Dense W·R and W·I for a sparse (batch × users) weight matrix."""
+        total_score = (W @ self.rating).toarray()
+        total_weight = (W @ self.rated).toarray()
+        if self.rating_delta is not None:
+            total_score += (W @ self.rating_delta).toarray()
+            total_weight += (W @ self.rated_delta).toarray()
+        return total_score, total_weight
+
+    def neighbor_sums(self, neighbors: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """1-D w·R and w·I for one user's neighbour rows."""
+        total_score = self.rating[neighbors].T @ weights
+        total_weight = self.rated[neighbors].T @ weights
+        if self.rating_delta is not None:
+            total_score += self.rating_delta[neighbors].T @ weights
+            total_weight += self.rated_delta[neighbors].T @ weights
+        return total_score, total_weight
+
+    def rated_items(self, user_id: int) -> np.ndarray:
+        """Item ids the user has already rated (empty for unknown ids)."""
+        if not 0 <= user_id < self.shape[0]:
+            return np.array([], dtype=np.int32)
+        seen = self.rated[user_id].indices
+        if self.rated_delta is not None:
+            fresh = self.rated_delta[user_id]
+            if fresh.nnz:
+                seen = np.union1d(seen, fresh.indices[fresh.data > 0])
+        return seen
+
+def training_matrix(ratings: pd.DataFrame) -> Tuple[csr_matrix, np.ndarray, np.ndarray]:
+    """
+    Compact user×item CSR for model fitting, built straight from the coded
+    (user, item) arrays. Rows/columns follow the sorted user/item ids, the
+    same layout pivot(...).fillna(0) produced, without the dense matrix.
+    Expects one row per (user, item).
+    """
+    user_codes, user_ids = pd.factorize(ratings["user"], sort=True)
+    item_codes, item_ids = pd.factorize(ratings["item"], sort=True)
+    values = ratings["rating"].to_numpy(dtype=np.float64)
+    R = csr_matrix((values, (user_codes, item_codes)), shape=(len(user_ids), len(item_ids)))
+    return R, np.asarray(user_ids), np.asarray(item_ids)
+
+# ─── Profiles ──────────────────────────────────────────────────────
+def side_info(scaler_age, ohe_gender, ohe_occupation) -> Dict[str, Any]:
+    """
+    Plain parameters of the fitted age scaler and gender/occupation
+    encoders, all side_features() needs, so serving never unpickles (or
+    imports) scikit-learn.
+    """
+    return {
+        "age_mean": float(scaler_age.mean_[0]),
+        "age_scale": float(scaler_age.scale_[0]),
+        "genders": [str(c) for c in ohe_gender.categories_[0]],
+        "occupations": [str(c) for c in ohe_occupation.categories_[0]],
+    }
+
+def _one_hot(values: pd.Series, categories: List[str]) -> np.ndarray:
+    # unknown categories encode as all zeros (handle_unknown="ignore")
+    return (values.to_numpy(dtype=str)[:, None] == np.asarray(categories, dtype=str)).astype(np.float64)
+
+def side_features(M: Dict[str, Any], meta: pd.DataFrame) -> np.ndarray:
+    """Scaled age + one-hot gender/occupation for user metadata rows."""
+    info = M["side_info"]
+    age = (meta["age"].to_numpy(dtype=np.float64) - info["age_mean"]) / info["age_scale"]
+    return np.hstack([
+        age[:, None],
+        _one_hot(meta["gender"], info["genders"]),
+        _one_hot(meta["occupation"], info["occupations"]),
+    ])
+
+def cold_start_profiles(M: Dict[str, Any], meta: pd.DataFrame) -> np.ndarray:
+    """Side-info-only profiles (zero latent factors) for user metadata rows."""
+    return np.hstack([np.zeros((len(meta), M["item_factors"].shape[1])), side_features(M, meta)])
+
+# ─── Neighbours ────────────────────────────────────────────────────
+def _model_rows(fitted: np.ndarray, fold: Optional[Dict[str, Any]], name: str, rows: np.ndarray) -> np.ndarray:
+    # rows past the fitted array are folded-in users, kept in M["fold"][name]
+    if fold is None:
+        return fitted[rows]
+    rows = np.asarray(rows)
+    out = np.empty(rows.shape + fitted.shape[1:], dtype=fitted.dtype)
+    is_fit = rows < len(fitted)
+    out[is_fit] = fitted[rows[is_fit]]
+    out[~is_fit] = fold[name][rows[~is_fit] - len(fitted)]
+    return out
+
+def _neighbor_weights(M: Dict[str, Any], dists: np.ndarray, idxs: np.ndarray):
+    # column 0 is the query itself, weights are inverse cosine distance
+    return _model_rows(M["user_ids"], M.get("fold"), "user_ids", idxs[:, 1:]), 1 / (dists[:, 1:] + 1e-6)
+
+def table_neighbors(M: Dict[str, Any], rows: np.ndarray):
+    """Neighbours of trained and folded-in users, read from the precomputed neighbour rows."""
+    table, fold = M["all_neighbors"], M.get("fold")
+    return _neighbor_weights(M, _model_rows(table["distances"], fold, "distances", rows),
+                             _model_rows(table["indices"], fold, "indices", rows))
+
+def query_neighbors(M: Dict[str, Any], profiles: np.ndarray):
+    """Neighbours of arbitrary profiles (cold-start) via the NN index."""
+    dists, idxs = M["nn_model"].kneighbors(profiles)
+    return _neighbor_weights(M, dists, idxs)
+
+# ─── Scoring ───────────────────────────────────────────────────────
+def score_items_batch(matrices: RatingMatrices, neighbors: np.ndarray, weights: np.ndarray,
+                      global_mean: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Weighted neighbour average for every item, for a batch of users:
+    pred = (w·R) / (w·I) + global_mean, where I is the rated indicator.
+    neighbors/weights are (B, k) arrays, one row per user. The weights are
+    scattered into a sparse B×users matrix W so the whole batch is scored by
+    W·R and W·I. Returns dense (B, items) pred and candidate mask; only items
+    rated by a neighbour are candidates.
+    """
+    n_users = neighbors.shape[0]
+    keep = neighbors < matrices.shape[0]
+    rows = np.broadcast_to(np.arange(n_users)[:, None], neighbors.shape)[keep]
+    W = csr_matrix((weights[keep], (rows, neighbors[keep])),
+                   shape=(n_users, matrices.shape[0]))
+
+    total_score, total_weight = matrices.weighted_sums(W)
+    pred = total_score / (total_weight + 1e-9) + global_mean
+    return pred, total_weight > 0
+
+def score_items(matrices: RatingMatrices, neighbors: np.ndarray, weights: np.ndarray,
+                global_mean: float) -> Tuple[np.ndarray, np.ndarray]:
+    """score_items_batch for a single user's 1-D neighbour/weight arrays."""
+    keep = neighbors < matrices.shape[0]
+    total_score, total_weight = matrices.neighbor_sums(neighbors[keep], weights[keep])
+    pred = total_score / (total_weight + 1e-9) + global_mean
+    return pred, total_weight > 0
+
+def top_n_items(pred: np.ndarray, candidates: np.ndarray,
+                seen: np.ndarray, n: int = 10) -> np.ndarray:
+    """
+    Highest-scoring candidate items not in `seen`, best first.
+    Ties are broken by the lower item id, like DataFrame.nlargest.
+    """
+    valid = candidates.copy()
+    seen = seen[seen < valid.size]
+    valid[seen] = False
+    cand = np.flatnonzero(valid)
+    if cand.size == 0 or n <= 0:
+        return cand[:0]
+
+    scores = pred[cand]
+    if cand.size > n:
+        # argpartition finds the n-th best score; keep every tie at that score
+        kth = scores[np.argpartition(-scores, n - 1)[n - 1]]
+        keep = scores >= kth
+        cand, scores = cand[keep], scores[keep]
+
+    order = np.lexsort((cand, -scores))[:n]
+    return cand[order]
+
+def top_n_batch(matrices: RatingMatrices, neighbors: np.ndarray, weights: np.ndarray,
+                global_mean: float, user_ids: np.ndarray, n: int = 10,
+                chunk_size: int = 512) -> List[np.ndarray]:
+    """
+    Top-N items for every row of a neighbour batch. Scoring runs in chunks
+    so the dense (chunk, items) buffers stay bounded for large batches.
+    """
+    results = []
+    for start in range(0, len(user_ids), chunk_size):
+        stop = start + chunk_size
+        pred, candidates = score_items_batch(matrices, neighbors[start:stop],
+                                             weights[start:stop], global_mean)
+        for row, uid in enumerate(user_ids[start:stop]):
+            seen = matrices.rated_items(int(uid))
+            results.append(top_n_items(pred[row], candidates[row], seen, n))
+    return results
+
+# ─── Precomputed top-N cache ───────────────────────────────────────
+TOP_N_CACHE_DEPTH = 50
+
+def build_top_n_cache(matrices: RatingMatrices, M: Dict[str, Any],
+                      depth: int = TOP_N_CACHE_DEPTH) -> Dict[int, np.ndarray]:
+    """
+    Top-`depth` items for every trained user in one batched pass over the
+    all_neighbors table. Storing more than the served 10 lets feedback
+    patches drop items without forcing a live re-score.
+    """
+    user_ids = np.asarray(M["user_ids"])
+    neighbors, weights = table_neighbors(M, np.arange(len(user_ids)))
+    tops = top_n_batch(matrices, neighbors, weights,
+                       float(M["global_mean"]), user_ids, n=depth)
+    return {int(uid): top for uid, top in zip(user_ids, tops)}
+
+def cached_top_n(cache: Optional[Dict[int, np.ndarray]], matrices: RatingMatrices,
+                 user_id: int, n: int = 10) -> Optional[np.ndarray]:
+    """
+    Serve top-n from the cache, skipping anything the user has rated since
+    it was built. Returns None on a miss or when too few items remain.
+    """
+    if not cache or n <= 0:
+        return None
+    items = cache.get(user_id)
+    if items is None:
+        return None
+    items = items[~np.isin(items, matrices.rated_items(user_id))]
+    if items.size < n:
+        return None
+    return items[:n]
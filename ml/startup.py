@@ -0,0 +1,129 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from data_manager import data_manager
+from metrics import STARTUP_PHASE_SECONDS
+from model_manager import model_manager
+
+logger = logging.getLogger("MLServiceLogger")
+
+# Threads loading titles, ratings, user metadata and the model bundle side by side
+STARTUP_WORKERS = int(os.getenv("STARTUP_WORKERS", "4"))
+
+# Startup:
+#
+#   titles  ratings  users  bundle        parallel; the bundle is mapped, not
+#      \       |       |     /            unpickled into scikit-learn objects
+#       '------+-------+----'
+#              |
+#            top_n (or train, without a saved model) -> publish -> ready
+#              |
+#            fold-in of users missing from the bundle (background worker)
+#
+# The app answers /ml/healthz from the first moment and /ml/readyz with 503
+# and this progress until the models are published, so a new replica gets
+# traffic only once it can serve it.
+
+class StartupProgress:
+    """
+    Where the background load behind /ml/readyz has got to. `state` goes
+    starting -> loading -> ready, or failed; each phase records whether it
+    is running, done or failed and how long it took.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.state = "starting"
+        self.error: Optional[str] = None
+        self.ready_after: Optional[float] = None
+        self.phases: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    @property
+    def failed(self) -> bool:
+        return self.state == "failed"
+
+    def run(self, phase: str, fn: Callable, *args) -> Any:
+        """Run one load phase, recording its state and duration."""
+        with self._lock:
+            self.phases[phase] = {"state": "running", "seconds": None}
+        start = time.perf_counter()
+        state = "failed"
+        try:
+            result = fn(*args)
+            state = "done"
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            STARTUP_PHASE_SECONDS.observe(elapsed, phase=phase)
+            with self._lock:
+                self.phases[phase] = {"state": state, "seconds": round(elapsed, 3)}
+
+    def set_state(self, state: str, error: Optional[str] = None):
+        with self._lock:
+            self.state = state
+            self.error = error
+            if state == "ready":
+                self.ready_after = time.time() - self.started
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "uptime": round(time.time() - self.started, 3),
+                "ready_after": None if self.ready_after is None else round(self.ready_after, 3),
+                "error": self.error,
+                "phases": {name: dict(info) for name, info in self.phases.items()},
+            }
+
+def load_service(progress: StartupProgress, workers: int = STARTUP_WORKERS):
+    """
+    Load everything the endpoints need and publish it, recording progress.
+    Titles, rating state, user metadata and the model bundle are read in
+    parallel; the top-N cache needs the ratings and the bundle, so it comes
+    last. Without any saved model one is trained here (in k8s the init
+    container has normally done that already).
+    """
+    progress.set_state("loading")
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="startup") as pool:
+            data = [
+                pool.submit(progress.run, "titles", data_manager.load_titles),
+                pool.submit(progress.run, "ratings", data_manager.load_rating_state),
+                pool.submit(progress.run, "users", data_manager.load_users),
+            ]
+            bundle = None
+            if model_manager.has_saved_model():
+                bundle = pool.submit(progress.run, "bundle", model_manager.read_models)
+            for future in data:
+                future.result()
+            if bundle is None:
+                logger.warning("No existing model found, starting initial training")
+                progress.run("train", model_manager.train_model)
+            else:
+                progress.run("top_n", model_manager.publish_loaded, bundle.result())
+                # users the bundle is behind on are folded in in the background
+                model_manager.fold_in_missing()
+    except Exception as e:
+        progress.set_state("failed", str(e))
+        logger.error(f"Initialization failed: {str(e)}",
+                     extra={'user_id': 'system', 'item_id': 'system'})
+        return
+    progress.set_state("ready")
+    logger.info("Service initialization completed successfully",
+                extra={'user_id': 'system', 'item_id': 'system',
+                       'ready_after': progress.ready_after})
+
+def start_loading(progress: StartupProgress) -> threading.Thread:
+    """Run load_service on a daemon thread so the app answers probes meanwhile."""
+    thread = threading.Thread(target=load_service, args=(progress,), name="startup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,65 @@
+import pandas as pd
+
+from feedback_log import FeedbackLog
+from ratings_export import read_ratings_page
+
+def _export(base_path, log, limit, between_pages=None):
+    """Every page of the export as (user, item, rating) tuples."""
+    rows, cursor, pages = [], None, 0
+    while True:
+        page, cursor = read_ratings_page(base_path, log, cursor, limit)
+        rows += list(zip(page["user_id"], page["item_id"], page["rating"]))
+        pages += 1
+        if cursor is None:
+            return rows
+        if between_pages:
+            between_pages(pages)
+
+def _write_base(path, rows):
+    pd.DataFrame(rows).to_csv(path, sep="\t", header=False, index=False)
+
+def test_pages_cover_base_then_feedback(tmp_path):
+    base_path = str(tmp_path / "u1.base")
+    _write_base(base_path, [(1, 10, 4, 100), (2, 20, 3, 100), (3, 30, 5, 100)])
+    log = FeedbackLog(str(tmp_path / "feedback.csv"), fsync_interval=0)
+    log.append(4, 40, 2.0)
+    log.append(5, 50, 1.0)
+
+    assert _export(base_path, log, limit=2) == [
+        (1, 10, 4.0), (2, 20, 3.0), (3, 30, 5.0), (4, 40, 2.0), (5, 50, 1.0),
+    ]
+
+def test_rerating_between_pages_skips_nothing(tmp_path):
+    base_path = str(tmp_path / "u1.base")
+    _write_base(base_path, [])
+    log = FeedbackLog(str(tmp_path / "feedback.csv"), fsync_interval=0)
+    for i in (1, 2, 3, 4):
+        log.append(i, i, 4.0)
+
+    # re-rate (1, 1) once the first feedback page has been read
+    def rerate(pages):
+        if pages == 2:
+            log.append(1, 1, 5.0)
+
+    rows = _export(base_path, log, limit=2, between_pages=rerate)
+    assert rows == [(1, 1, 4.0), (2, 2, 4.0), (3, 3, 4.0), (4, 4, 4.0), (1, 1, 5.0)]
+    # last write wins on the client side
+    latest = {(u, i): r for u, i, r in rows}
+    assert latest == {(1, 1): 5.0, (2, 2): 4.0, (3, 3): 4.0, (4, 4): 4.0}
+
+def test_torn_line_waits_for_the_next_page(tmp_path):
+    base_path = str(tmp_path / "u1.base")
+    _write_base(base_path, [])
+    log = FeedbackLog(str(tmp_path / "feedback.csv"), fsync_interval=0)
+    log.append(1, 1, 4.0)
+    with open(log.path, "ab") as f:
+        f.write(b"2,2,")
+
+    page, cursor = read_ratings_page(base_path, log, None, 10)
+    page, cursor = read_ratings_page(base_path, log, cursor, 10)
+    assert list(page["user_id"]) == [1]
+    with open(log.path, "ab") as f:
+        f.write(b"3.0\n")
+    page, cursor = read_ratings_page(base_path, log, cursor, 10)
+    assert list(zip(page["user_id"], page["rating"])) == [(2, 3.0)]
+    assert cursor is None
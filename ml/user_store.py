@@ -0,0 +1,220 @@
+import io
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, List, Optional
+
+USER_COLUMNS = ["user_id", "age", "gender", "occupation", "zip_code"]
+
+class UserStore:
+    """
+    In-memory copy of u.user kept as compact NumPy columns.
+    Gender and occupation are dictionary-encoded; a dense id -> row array
+    gives O(1) lookups. u.user stays the durable append-only log: it is
+    parsed once at startup and every new user is appended to both; lines
+    other workers append are picked up by refresh().
+    `updated` is when a user was written, read from the `<path>.updated`
+    sidecar log (one "user_id|unix time" line per append, written just
+    before the u.user line, so u.user keeps the MovieLens format). Users
+    without an entry, such as the seed data, have 0.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.times_path = f"{path}.updated"
+        self._lock = threading.Lock()
+        # bytes of u.user / the sidecar already parsed
+        self._offset = 0
+        self._times_offset = 0
+        # user id -> last write time from the sidecar
+        self._written: Dict[int, float] = {}
+        self._reset(0)
+
+    def _reset(self, capacity: int):
+        self.size = 0
+        self.user_id = np.zeros(capacity, dtype=np.int64)
+        self.age = np.zeros(capacity, dtype=np.int16)
+        self.gender = np.zeros(capacity, dtype=np.int8)
+        self.occupation = np.zeros(capacity, dtype=np.int16)
+        self.zip_code = np.zeros(capacity, dtype="U10")
+        self.updated = np.zeros(capacity, dtype=np.float64)
+        self.genders: List[str] = []
+        self.occupations: List[str] = []
+        self._codes: Dict[str, Dict[str, int]] = {"gender": {}, "occupation": {}}
+        self.index = np.full(0, -1, dtype=np.int64)
+
+    # ─── Loading / appending ─────────────────────────────────────────
+    def load(self):
+        """Parse u.user once; later duplicates of an id win."""
+        with self._lock:
+            self._reset(0)
+            self._offset = 0
+            self._times_offset = 0
+            self._written = {}
+            self._read_times()
+            if not os.path.exists(self.path):
+                return
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            # a line another worker is still writing is left for refresh()
+            raw = raw[:raw.rfind(b"\n") + 1]
+            self._offset = len(raw)
+            df = pd.read_csv(io.BytesIO(raw), sep="|", names=USER_COLUMNS,
+                             dtype={"zip_code": str}, keep_default_na=False)
+            gender_codes, self.genders = pd.factorize(df["gender"].astype(str))
+            occ_codes, self.occupations = pd.factorize(df["occupation"].astype(str))
+            self.genders, self.occupations = list(self.genders), list(self.occupations)
+            self._codes = {
+                "gender": {v: i for i, v in enumerate(self.genders)},
+                "occupation": {v: i for i, v in enumerate(self.occupations)},
+            }
+
+            self.size = len(df)
+            self._grow(max(self.size, 1024))
+            self.user_id[:self.size] = df["user_id"].to_numpy()
+            self.age[:self.size] = df["age"].to_numpy()
+            self.gender[:self.size] = gender_codes
+            self.occupation[:self.size] = occ_codes
+            self.zip_code[:self.size] = df["zip_code"].to_numpy(dtype=str)
+            self.updated[:self.size] = df["user_id"].map(self._written).fillna(0.0).to_numpy()
+
+            latest = np.flatnonzero(~df["user_id"].duplicated(keep="last").to_numpy())
+            self.index = np.full(self.max_user_id() + 1, -1, dtype=np.int64)
+            self.index[self.user_id[latest]] = latest
+
+    def append(self, user_id: int, age: int, gender: str, occupation: str, zip_code: str):
+        """
+        Durably log a new user to u.user, then make it visible in memory.
+        Callers allocating ids across workers hold DataManager.users_lock.
+        """
+        with self._lock:
+            self._read_new()
+            now = time.time()
+            # the time first: a u.user line is never visible without it
+            with open(self.times_path, "a") as f:
+                f.write(f"{user_id}|{now!r}\n")
+                f.flush()
+                self._times_offset = f.tell()
+            with open(self.path, "a") as f:
+                f.write(f"{user_id}|{age}|{gender}|{occupation}|{zip_code}\n")
+                f.flush()
+                self._offset = f.tell()
+            self._written[user_id] = now
+            self._append_row(user_id, age, gender, occupation, zip_code, now)
+
+    def refresh(self) -> int:
+        """Pick up users appended to u.user by other processes; returns how many."""
+        with self._lock:
+            return self._read_new()
+
+    @staticmethod
+    def _read_tail(path: str, offset: int) -> bytes:
+        # complete lines written after `offset`; a torn last line is left for later
+        try:
+            if os.path.getsize(path) <= offset:
+                return b""
+        except FileNotFoundError:
+            return b""
+        with open(path, "rb") as f:
+            f.seek(offset)
+            raw = f.read()
+        return raw[:raw.rfind(b"\n") + 1]
+
+    def _read_times(self):
+        raw = self._read_tail(self.times_path, self._times_offset)
+        self._times_offset += len(raw)
+        for line in raw.decode().splitlines():
+            fields = line.split("|")
+            if len(fields) == 2:
+                self._written[int(fields[0])] = float(fields[1])
+
+    def _read_new(self) -> int:
+        self._read_times()
+        raw = self._read_tail(self.path, self._offset)
+        self._offset += len(raw)
+        added = 0
+        for line in raw.decode().splitlines():
+            fields = line.split("|")
+            if len(fields) == len(USER_COLUMNS):
+                user_id = int(fields[0])
+                self._append_row(user_id, int(fields[1]), fields[2], fields[3], fields[4],
+                                 self._written.get(user_id, 0.0))
+                added += 1
+        return added
+
+    def _encode(self, column: str, value: str) -> int:
+        codes = self._codes[column]
+        if value not in codes:
+            codes[value] = len(codes)
+            (self.genders if column == "gender" else self.occupations).append(value)
+        return codes[value]
+
+    def _append_row(self, user_id: int, age: int, gender: str, occupation: str, zip_code: str,
+                    updated: float):
+        if self.size == self.user_id.size:
+            self._grow(max(2 * self.size, 1024))
+        if user_id >= self.index.size:
+            index = np.full(max(2 * self.index.size, user_id + 1), -1, dtype=np.int64)
+            index[:self.index.size] = self.index
+            self.index = index
+
+        row = self.size
+        self.user_id[row] = user_id
+        self.age[row] = age
+        self.gender[row] = self._encode("gender", gender)
+        self.occupation[row] = self._encode("occupation", occupation)
+        self.zip_code[row] = zip_code
+        self.updated[row] = updated
+        self.index[user_id] = row
+        self.size += 1
+
+    def _grow(self, capacity: int):
+        for name in ("user_id", "age", "gender", "occupation", "zip_code", "updated"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:old.size] = old
+            setattr(self, name, new)
+
+    # ─── Reads ───────────────────────────────────────────────────────
+    def max_user_id(self) -> int:
+        return int(self.user_id[:self.size].max()) if self.size else 0
+
+    def __contains__(self, user_id: int) -> bool:
+        return 0 <= user_id < self.index.size and self.index[user_id] >= 0
+
+    def _frame(self, rows: np.ndarray) -> pd.DataFrame:
+        return pd.DataFrame({
+            "age": self.age[rows].astype(np.int64),
+            "gender": np.asarray(self.genders, dtype=object)[self.gender[rows]],
+            "occupation": np.asarray(self.occupations, dtype=object)[self.occupation[rows]],
+            "zip_code": self.zip_code[rows].astype(object),
+        }, index=pd.Index(self.user_id[rows], name="user_id"))
+
+    def rows(self, user_ids: Iterable[int]) -> pd.DataFrame:
+        """Metadata for the known ids among user_ids, indexed by user_id."""
+        with self._lock:
+            ids = np.asarray(list(user_ids), dtype=np.int64)
+            ids = ids[(ids >= 0) & (ids < self.index.size)]
+            rows = self.index[ids]
+            return self._frame(rows[rows >= 0])
+
+    def get(self, user_id: int) -> Optional[Dict]:
+        meta = self.rows([user_id])
+        if meta.empty:
+            return None
+        return {"user_id": user_id, **meta.iloc[0].to_dict()}
+
+    def frame(self) -> pd.DataFrame:
+        """Every user (latest entry per id) as a DataFrame indexed by user_id."""
+        with self._lock:
+            rows = self.index[self.index >= 0]
+            return self._frame(np.sort(rows))
+
+    def export_frame(self) -> pd.DataFrame:
+        """Every user sorted by id, with the raw columns plus `updated`."""
+        with self._lock:
+            rows = self.index[self.index >= 0]
+            frame = self._frame(rows).assign(updated=self.updated[rows])
+        return frame.reset_index()
@@ -4,16 +4,41 @@ import axios from "axios";
 const ML_URL = process.env.ML_URL || "http://ml-service:8000";        //k8s and compose
 // const ML_URL = process.env.ML_URL || "http://movie-recc-ml-service:8000";   //compose
 
-export const getAllUsers = async () => {
-    const res = await axios.get(`${ML_URL}/ml/users`);
+// One page of users ordered by id; pass `nextCursor` back as `cursor` until
+// it comes back null. `exportTime` of the first page is the `updatedSince`
+// to use for the next incremental sync.
+export const getUsersPage = async ({ cursor, updatedSince, limit } = {}) => {
+    const res = await axios.get(`${ML_URL}/ml/users`, {
+        params: { cursor, updated_since: updatedSince, limit }
+    });
 
-    return res.data;
+    return {
+        users: res.data,
+        nextCursor: res.headers['x-next-cursor'] || null,
+        exportTime: parseInt(res.headers['x-export-time'])
+    };
 }
 
-export const getAllRatings = async () => {
-    const res = await axios.get(`${ML_URL}/ml/ratings`);
+// One page of the NDJSON rating export. Pass `nextCursor` back as `cursor`
+// until it comes back null; `exportTime` of the first page is the `since`
+// to use for the next incremental sync.
+export const getRatingsPage = async ({ cursor, since, limit } = {}) => {
+    const res = await axios.get(`${ML_URL}/ml/ratings`, {
+        params: { cursor, since, limit },
+        responseType: 'text',
+        transformResponse: [data => data]
+    });
 
-    return res.data;
+    const ratings = res.data
+        .split('\n')
+        .filter(line => line.length > 0)
+        .map(line => JSON.parse(line));
+
+    return {
+        ratings,
+        nextCursor: res.headers['x-next-cursor'] || null,
+        exportTime: parseInt(res.headers['x-export-time'])
+    };
 }
 
 export const addUser = async (user) => {
@@ -33,6 +58,15 @@ export const fetchRecommendation = async ( uid ) => {
     return res.data;
 }
 
+export const fetchRecommendationsBatch = async ( uids, topN = 10 ) => {
+    const res = await axios.post(`${ML_URL}/ml/recommend/batch`, {
+        user_ids: uids,
+        top_n: topN
+    });
+
+    return res.data;
+}
+
 export const addFeedback = async (feedback) => {
     const res = await axios.post(`${ML_URL}/ml/feedback`, {
         user_id: feedback.uid,
@@ -1,6 +1,6 @@
 import mongoose from 'mongoose';
 import User from '../model/userSchema.js';
-import { getAllUsers, getAllRatings } from './mlClient.js'; // Changed import
+import { getUsersPage, getRatingsPage } from './mlClient.js'; // Changed import
 
 const validOccupations = [
   'administrator', 'artist', 'doctor', 'educator', 'engineer',
@@ -9,81 +9,139 @@ const validOccupations = [
   'salesman', 'scientist', 'student', 'technician', 'writer'
 ];
 
+// Export time of the last completed user sync; the first sync after a
+// restart pulls every user, later ones only those written since.
+let lastUserSync = null;
+
 export async function syncUsers() {
   try {
-    const mlUsers = await getAllUsers(); // Directly use imported function
-    const operations = mlUsers.map(mlUser => ({
-      updateOne: {
-        filter: { ml_user_id: mlUser.user_id },
-        update: {
-          $setOnInsert: {
-            username: `user${mlUser.user_id}`,
-            email: `user${mlUser.user_id}@gmail.com`,
-            password: `pass${mlUser.user_id}`
+    const updatedSince = lastUserSync;
+    let cursor = null;
+    let exportTime = null;
+    let users = 0;
+
+    for (;;) {
+      const page = await getUsersPage({ cursor, updatedSince: updatedSince ?? undefined });
+      exportTime = exportTime ?? page.exportTime;
+
+      const operations = page.users.map(mlUser => ({
+        updateOne: {
+          filter: { ml_user_id: mlUser.user_id },
+          update: {
+            $setOnInsert: {
+              username: `user${mlUser.user_id}`,
+              email: `user${mlUser.user_id}@gmail.com`,
+              password: `pass${mlUser.user_id}`
+            },
+            $set: {
+              age: parseInt(mlUser.age) || 25,
+              gender: mlUser.gender === 'M' ? 'M' : 'F',
+              occupation: validOccupations.includes(mlUser.occupation.toLowerCase()) 
+                ? mlUser.occupation 
+                : 'other',
+              zip_code: /^\d{5}$/.test(mlUser.zip_code) ? mlUser.zip_code : '00000'
+            }
           },
-          $set: {
-            age: parseInt(mlUser.age) || 25,
-            gender: mlUser.gender === 'M' ? 'M' : 'F',
-            occupation: validOccupations.includes(mlUser.occupation.toLowerCase()) 
-              ? mlUser.occupation 
-              : 'other',
-            zip_code: '00000'
-          }
-        },
-        upsert: true
-      }
-    }));
+          upsert: true
+        }
+      }));
 
-    if (operations.length > 0) {
-      await User.bulkWrite(operations, { ordered: false });
+      if (operations.length > 0) {
+        await User.bulkWrite(operations, { ordered: false });
+      }
+      users += operations.length;
+      cursor = page.nextCursor;
+      if (!cursor) break;
     }
-    return { users: operations.length };
+
+    lastUserSync = exportTime;
+    return { users };
   } catch (error) {
     console.error('User sync error:', error);
     throw error;
   }
 }
 
-export async function syncRatings() {
-  try {
-    const mlRatings = await getAllRatings();
-    const userMap = new Map();
-
-    // Group ratings by user and movie_id (unique per movie)
-    mlRatings.forEach(rating => {
-      const userId = rating.user_id;
-      const movieId = rating.item_id;
-      
-      if (!userMap.has(userId)) {
-        userMap.set(userId, new Map());
+// Export time of the last completed rating sync; the first sync after a
+// restart pulls everything, later ones only what changed since.
+let lastRatingSync = null;
+
+async function applyRatingsPage(ratings) {
+  const userMap = new Map();
+
+  // Group ratings by user and movie_id (unique per movie)
+  ratings.forEach(rating => {
+    const userId = rating.user_id;
+    const movieId = rating.item_id;
+
+    if (!userMap.has(userId)) {
+      userMap.set(userId, new Map());
+    }
+
+    // Overwrite existing entry if movie_id exists
+    userMap.get(userId).set(movieId, {
+      movie_id: movieId,
+      rating: rating.rating,
+      timestamp: new Date(rating.timestamp * 1000 || Date.now())
+    });
+  });
+
+  // Replace just the exported movies in each watchlist: drop the old
+  // entries, then push the new ones (ordered, so the pull runs first)
+  const operations = [];
+  for (const [userId, movies] of userMap) {
+    const filter = { ml_user_id: parseInt(userId) };
+    operations.push({
+      updateOne: {
+        filter,
+        update: { $pull: { watchlist: { movie_id: { $in: Array.from(movies.keys()) } } } }
       }
-      
-      // Overwrite existing entry if movie_id exists
-      userMap.get(userId).set(movieId, {
-        movie_id: movieId,
-        rating: rating.rating,
-        timestamp: new Date(rating.timestamp * 1000 || Date.now())
-      });
     });
+    operations.push({
+      updateOne: {
+        filter,
+        update: { $push: { watchlist: { $each: Array.from(movies.values()) } } }
+      }
+    });
+  }
 
-    const operations = [];
-    for (const [userId, movies] of userMap) {
-      operations.push({
-        updateOne: {
-          filter: { ml_user_id: parseInt(userId) },
-          update: {
-            $set: {  // Replace existing watchlist
-              watchlist: Array.from(movies.values())
-            }
-          }
+  if (operations.length > 0) {
+    await User.bulkWrite(operations, { ordered: true });
+  }
+}
+
+export async function syncRatings() {
+  try {
+    const since = lastRatingSync;
+    let cursor = null;
+    let exportTime = null;
+    let ratings = 0;
+    let restarted = false;
+
+    // Page through the export so only one page is held at a time
+    for (;;) {
+      let page;
+      try {
+        page = await getRatingsPage({ cursor, since: since ?? undefined });
+      } catch (error) {
+        // 410: the ML service merged its feedback mid-export, start over once
+        if (error.response?.status === 410 && !restarted) {
+          restarted = true;
+          cursor = null;
+          exportTime = null;
+          continue;
         }
-      });
+        throw error;
+      }
+      exportTime = exportTime ?? page.exportTime;
+      await applyRatingsPage(page.ratings);
+      ratings += page.ratings.length;
+      cursor = page.nextCursor;
+      if (!cursor) break;
     }
 
-    if (operations.length > 0) {
-      await User.bulkWrite(operations, { ordered: false });
-    }
-    return { ratings: operations.length };
+    lastRatingSync = exportTime;
+    return { ratings };
   } catch (error) {
     console.error('Rating sync error:', error);
     throw error;